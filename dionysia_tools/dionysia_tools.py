@@ -1,4 +1,5 @@
 import click
+import logging
 import os
 import pyfiglet
 import schedule
@@ -15,8 +16,37 @@ cfg = None
 log = None
 notify = None
 
+# Trakt fields needed to match list items against Plex
+plex_match_fields = ['movie.title', 'movie.year', 'movie.ids']
+
+
+def plex_titles_years(trakt_movies, entries=None):
+    """Plex match entries of trakt_movies, also appended to entries when given"""
+    for trakt_movie in trakt_movies:
+        entry = {
+            'title': trakt_movie['movie']['title'],
+            'year': trakt_movie['movie']['year'],
+            'ids': trakt_movie['movie'].get('ids'),
+        }
+        if entries is not None:
+            entries.append(entry)
+        yield entry
+
+
+class Group(click.Group):
+    def invoke(self, ctx):
+        try:
+            return super().invoke(ctx)
+        except Exception as e:
+            from .utils.breaker import CircuitOpenError
+            if not isinstance(e, CircuitOpenError):
+                raise
+            log.error("Stopping this run, %s", e)
+            sys.exit(1)
+
+
 # Click
-@click.group(help='Various tools to manage my plex server.')
+@click.group(cls=Group, help='Various tools to manage my plex server.')
 @click.version_option('0.1.0a', prog_name='Dionsyia_Tools')
 @click.option(
     '--config',
@@ -97,17 +127,25 @@ def app(config, cachefile, logfile, verbose):
 def plex_collections(library, trending, popular, list_names, stage):
     """Will update Plex's Collections based on lists per the config file.
     It can also create a dynamic Trending and Watched (Popular) trakt collections.
+    Lists with the trakt-chart agent split one crawl of a Trakt chart (source:
+    trending, popular or watched, the first pages pages) by their years,
+    runtimes, genres, languages and countries.
     """
     if not list_names:
         list_names = cfg['plex-collections'].keys()
 
-    from .interfaces.trakt import Trakt
+    from concurrent.futures import ThreadPoolExecutor
+    from .interfaces.trakt import Trakt, TraktError
     from .interfaces.plex import Plex
     from .interfaces.json import JSONList
     plex = Plex(cfg)
     trakt = Trakt(cfg)
     json_list = JSONList(cfg)
 
+    consumer = 'plex-collections {}'.format(library)
+    json_lists = []
+    trakt_lists = []
+    chart_lists = {}
     for name in list_names:
         if name not in cfg['plex-collections']:
             example = {
@@ -125,50 +163,104 @@ def plex_collections(library, trending, popular, list_names, stage):
             break
         list_details = cfg['plex-collections'][name]
         if list_details['agent'] == 'json':
-            list_items = json_list.get_list(list_details['url'], name)
-            for collection in list_items:
-                plex.update_collection(library,
-                                       collection['list_movies'],
-                                       collection['collection_name'],
-                                       stage)
+            json_lists.append(name)
         if list_details['agent'] == 'trakt':
-            trakt_movies = trakt.get_user_list_movies(list_details['user'], list_details['list_id'])
-            trakt_movie_list = []
-            for trakt_movie in trakt_movies:
-                trakt_movie_list.append({
-                    'title': trakt_movie['movie']['title'],
-                    'year': trakt_movie['movie']['year'],
-                })
-            plex.update_collection(library,
-                                   trakt_movie_list,
-                                   list_details['name'],
-                                   stage)
-
-    if trending:
-        trakt_movies = trakt.get_top_trending_movies(30)
-        trakt_movie_list = []
-        for trakt_movie in trakt_movies:
-            trakt_movie_list.append({
-                'title': trakt_movie['movie']['title'],
-                'year': trakt_movie['movie']['year'],
-            })
-        plex.update_collection(library,
-                               trakt_movie_list,
-                               'Trakt Trending',
-                               stage)
-
-    if popular:
-        trakt_movies = trakt.get_top_most_watched_movies(30)
-        trakt_movie_list = []
-        for trakt_movie in trakt_movies:
-            trakt_movie_list.append({
-                'title': trakt_movie['movie']['title'],
-                'year': trakt_movie['movie']['year'],
-            })
-        plex.update_collection(library,
-                               trakt_movie_list,
-                               'Trakt Popular',
-                               stage)
+            trakt_lists.append(name)
+        if list_details['agent'] == 'trakt-chart':
+            chart_lists.setdefault(list_details.get('source') or 'trending', []).append(name)
+
+    # start every fetch at once so the total wait tracks the slowest list, Trakt lists are streamed into the
+    # Plex matching as their pages arrive, against the section index loaded once first
+    workers = cfg['trakt']['list_workers'] or 1
+    with ThreadPoolExecutor(max_workers=workers + 1) as pool:
+        index = pool.submit(plex.get_index, library)
+        tasks = {name: pool.submit(plex_collection_from_list, trakt, plex, library, index, consumer,
+                                   cfg['plex-collections'][name])
+                 for name in trakt_lists}
+        fetches = {name: pool.submit(json_list.get_list, cfg['plex-collections'][name]['url'], name)
+                   for name in json_lists}
+        # the lists of one chart share a single crawl, deep enough for the one asking for most pages
+        partitions = {source: pool.submit(trakt.get_partitioned_movies,
+                                          {name: cfg['plex-collections'][name] for name in names}, source, 100,
+                                          max(cfg['plex-collections'][name].get('pages') or 10 for name in names))
+                      for source, names in chart_lists.items()}
+        charts = {}
+        if trending:
+            charts['Trakt Trending'] = pool.submit(trakt.get_top_trending_movies, 30, extended='min',
+                                                   fields=plex_match_fields)
+        if popular:
+            charts['Trakt Popular'] = pool.submit(trakt.get_top_most_watched_movies, 30, extended='min',
+                                                  fields=plex_match_fields)
+
+        # match every list first, then reconcile all their collections in one pass over the library
+        index.result()
+        collections = {}
+        for name in json_lists:
+            for collection in fetches[name].result() or []:
+                collections[collection['collection_name']] = plex.match_collection(library,
+                                                                                  collection['list_movies'])
+
+        handled = []
+        for name, task in tasks.items():
+            list_details = cfg['plex-collections'][name]
+            try:
+                collections[list_details['name']], seen = task.result()
+            except TraktError as e:
+                log.error("Skipping collection %s, %s", list_details['name'], e)
+                continue
+            if seen is not None:
+                handled.append((list_details, seen))
+
+        for source, partitioned in partitions.items():
+            partitioned = partitioned.result()
+            if partitioned is None:
+                log.error("Skipping the collections split from the Trakt %s movies", source)
+                continue
+            for name, trakt_movies in partitioned.items():
+                collections[cfg['plex-collections'][name]['name']] = plex.match_collection(
+                    library, plex_titles_years(trakt_movies))
+
+        for name, chart in charts.items():
+            trakt_movies = chart.result()
+            if trakt_movies:
+                collections[name] = plex.match_collection(library, plex_titles_years(trakt_movies))
+
+    # every collection change is buffered and written per movie once all collections are reconciled
+    with plex.buffered():
+        plex.reconcile_collections(library, collections, stage)
+    plex.save_index()
+
+    # lists are only remembered once their changes are written
+    if not stage:
+        for list_details, (updated_at, entries) in handled:
+            trakt.remember_user_list(consumer, list_details['user'], list_details['list_id'], updated_at,
+                                     entries=entries)
+
+
+def plex_collection_from_list(trakt, plex, library, index, consumer, list_details):
+    """
+    Match one Trakt list against library once the index future is done and
+    return (records, seen). The list is streamed into the matching when it
+    moved since the last run, seen then holds the (updated_at, entries) to
+    remember once the collection is written, otherwise its stored entries are
+    matched again and seen is None. Raises TraktError when it can not be read.
+    """
+    updated_at = trakt.user_list_updated_at(list_details['user'], list_details['list_id'])
+    stored = trakt.user_list_seen(consumer, list_details['user'], list_details['list_id']) or {}
+    index.result()
+    if 'entries' in stored and trakt.user_list_unchanged(consumer, list_details['user'], list_details['list_id'],
+                                                         updated_at):
+        # the list has not moved but the library may have, so its last entries are matched again
+        log.info("Collection %s, list unchanged since the last run, matching its stored entries",
+                 list_details['name'])
+        return plex.match_collection(library, stored['entries']), None
+
+    trakt_movies = trakt.iter_user_list_movies(list_details['user'],
+                                               list_details['list_id'],
+                                               extended='min', fields=plex_match_fields)
+    # the collection is only reconciled once every page has been matched
+    entries = []
+    return plex.match_collection(library, plex_titles_years(trakt_movies, entries)), (updated_at, entries)
 
 
 ############################################################
@@ -199,16 +291,18 @@ def plex_recently_added(library, number):
     plex = Plex(cfg)
     trakt = Trakt(cfg)
 
-    trakt_trending = trakt.get_top_trending_movies(number)
+    trakt_trending = trakt.get_top_trending_movies(number, extended='min', fields=plex_match_fields)
     minutes = 60 * 24 + number
     for trakt_movie in trakt_trending:
         plex.get_movie_then_push_addedAt(
             section=library,
             title=trakt_movie['movie']['title'],
             year=trakt_movie['movie']['year'],
-            timedelta_minutes=minutes
+            timedelta_minutes=minutes,
+            ids=trakt_movie['movie'].get('ids'),
         )
         minutes += 1
+    plex.save_index()
 
 
 ############################################################
@@ -367,11 +461,14 @@ def trakt_update(list_names, stage):
     if not list_names:
         list_names = cfg['trakt-update'].keys()
 
+    from concurrent.futures import ThreadPoolExecutor
     from .interfaces.trakt import Trakt
     from .interfaces.json import JSONList
+    from .utils.breaker import CircuitOpenError
     stevenlu = JSONList(cfg)
     trakt = Trakt(cfg)
 
+    lists = {}
     for name in list_names:
         if name not in cfg['trakt-update']:
             example = {
@@ -383,23 +480,91 @@ def trakt_update(list_names, stage):
                 }}
             log.error("You will need to add '%s' to {'trakt-update':{}} in the Configuration file", example)
             break
-        list_details = cfg['trakt-update'][name]
-        list_items = set(stevenlu.get_list_imdb(list_details['stevenlu_url'], name))
-        trakt_items = set(trakt.get_user_list_movies_imdb(list_details['user'], list_details['list_id']))
-
-        remove_ids = list(trakt_items.difference(list_items))
-        add_ids = list(list_items.difference(trakt_items))
-        other_ids = list(list_items.intersection(trakt_items))
-
-        if stage:
-            log.info("STAGING: %s, will REMOVE %s", name, remove_ids)
-            log.info("STAGING: %s, will ADD %s", name, add_ids)
-            log.info("STAGING: %s, will NOT CHANGE %s", name, other_ids)
-        else:
-            if add_ids:
-                trakt.post_user_list_movies_imdb(list_details['user'], list_details['list_id'], add_ids)
-            if remove_ids:
-                trakt.delete_user_list_movies_imdb(list_details['user'], list_details['list_id'], remove_ids)
+        lists[name] = cfg['trakt-update'][name]
+
+    # lists run side by side, their reports are logged together in the configured order
+    workers = cfg['trakt']['list_workers'] or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(max_workers=workers * 2) as fetcher:
+        reports = {name: pool.submit(trakt_update_list, trakt, stevenlu, fetcher, name, list_details, stage)
+                   for name, list_details in lists.items()}
+        for name, report in reports.items():
+            # one failing list must not stop the others from being reported
+            try:
+                report = report.result()
+            except CircuitOpenError:
+                raise
+            except Exception:
+                log.exception("%s, failed, SKIPPED", name)
+                continue
+            for level, message in report:
+                log.log(level, message)
+
+
+def trakt_update_list(trakt, stevenlu, fetcher, name, list_details, stage):
+    """
+    Sync one trakt-update list and return its report as (level, message)
+    pairs. The feed and the Trakt list are fetched side by side on fetcher.
+    """
+    from .helpers.misc import fingerprint
+    report = []
+    user, list_id = list_details['user'], list_details['list_id']
+
+    feed = fetcher.submit(stevenlu.get_list_imdb, list_details['stevenlu_url'], name)
+    updated_at = trakt.user_list_updated_at(user, list_id)
+    seen = trakt.user_list_seen('trakt-update', user, list_id)
+    # once the Trakt side has moved its items are needed whatever the feed holds
+    trakt_items = None
+    if updated_at is None or seen is None or seen['updated_at'] != updated_at:
+        trakt_items = fetcher.submit(trakt.get_user_list_movies_imdb_set, user, list_id)
+
+    list_items = feed.result()
+    if list_items is None:
+        if trakt_items is not None:
+            trakt_items.cancel()
+        report.append((logging.ERROR, "{}, could not retrieve the feed, SKIPPED".format(name)))
+        return report
+    list_items = set(list_items)
+    feed_fingerprint = fingerprint(list_items)
+
+    if trakt_items is None:
+        if trakt.user_list_unchanged('trakt-update', user, list_id, updated_at, feed_fingerprint):
+            if stage:
+                report.append((logging.INFO, "STAGING: {}, feed and list unchanged since the last run, SKIPPED"
+                               .format(name)))
+            else:
+                report.append((logging.INFO, "Skipping {}, feed and list unchanged since the last run".format(name)))
+            return report
+        trakt_items = fetcher.submit(trakt.get_user_list_movies_imdb_set, user, list_id)
+
+    trakt_items = trakt_items.result()
+    if trakt_items is None:
+        report.append((logging.ERROR, "{}, could not retrieve the Trakt list, SKIPPED".format(name)))
+        return report
+
+    remove_ids = list(trakt_items.difference(list_items))
+    add_ids = list(list_items.difference(trakt_items))
+    other_ids = list(list_items.intersection(trakt_items))
+
+    if stage:
+        report.append((logging.INFO, "STAGING: {}, will REMOVE {}".format(name, remove_ids)))
+        report.append((logging.INFO, "STAGING: {}, will ADD {}".format(name, add_ids)))
+        report.append((logging.INFO, "STAGING: {}, will NOT CHANGE {}".format(name, other_ids)))
+        return report
+
+    if add_ids:
+        written = trakt.post_user_list_movies_imdb(user, list_id, add_ids)
+        report.append((logging.INFO if written else logging.ERROR,
+                       "{}, {} {} addition(s)".format(name, 'sent' if written else 'failed sending', len(add_ids))))
+    if remove_ids:
+        written = trakt.delete_user_list_movies_imdb(user, list_id, remove_ids)
+        report.append((logging.INFO if written else logging.ERROR,
+                       "{}, {} {} removal(s)".format(name, 'sent' if written else 'failed sending',
+                                                    len(remove_ids))))
+    # writing moves updated_at, so a list is only remembered on the run that finds nothing to do
+    if not add_ids and not remove_ids:
+        trakt.remember_user_list('trakt-update', user, list_id, updated_at, feed_fingerprint)
+        report.append((logging.INFO, "{}, already up to date".format(name)))
+    return report
 
 
 ############################################################
@@ -0,0 +1,51 @@
+"""
+JSON codec used by every interface, the config file and the store.
+
+Uses orjson or ujson when one of them is installed and falls back to the
+standard library otherwise. Anything the fast backend refuses (i.e. an
+indent other than 2 for orjson) is handed to the standard library.
+"""
+import json
+
+try:
+    import orjson as _backend
+    backend = 'orjson'
+except ImportError:
+    try:
+        import ujson as _backend
+        backend = 'ujson'
+    except ImportError:
+        _backend = json
+        backend = 'json'
+
+# True when decoding is faster than the standard library's
+accelerated = backend != 'json'
+
+
+def loads(data):
+    if isinstance(data, (bytes, bytearray)) and backend == 'json':
+        data = data.decode('utf-8')
+    return _backend.loads(data)
+
+
+def dumps(obj, indent=None, sort_keys=False):
+    if backend == 'orjson' and indent in (None, 2):
+        option = (_backend.OPT_INDENT_2 if indent else 0) | (_backend.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            return _backend.dumps(obj, option=option).decode('utf-8')
+        except TypeError:
+            pass
+    elif backend == 'ujson':
+        try:
+            return _backend.dumps(obj, indent=indent or 0, sort_keys=sort_keys, ensure_ascii=False)
+        except (TypeError, OverflowError):
+            pass
+    return json.dumps(obj, indent=indent, sort_keys=sort_keys)
+
+
+def load(fp):
+    return loads(fp.read())
+
+
+def dump(obj, fp, indent=None, sort_keys=False):
+    fp.write(dumps(obj, indent=indent, sort_keys=sort_keys))
@@ -0,0 +1,115 @@
+import codecs
+import itertools
+import json
+
+from . import codec
+
+_whitespace = ' \t\n\r'
+
+
+def iter_text(chunks, encoding='utf-8'):
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def _expect_end(tail, chunks):
+    """Drain what follows the closing bracket, failing on anything but whitespace like a whole-document decode"""
+    for text in itertools.chain([tail], chunks):
+        if text.strip(_whitespace):
+            raise ValueError("Extra data after the JSON array: %r" % text.strip(_whitespace)[:20])
+
+
+def iter_json_array(chunks):
+    """
+    Yield the elements of a JSON array as the text chunks holding it arrive.
+
+    Only the unparsed tail of the text is buffered, so the raw document and
+    the decoded elements are never held in memory at the same time.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+    state = 'start'
+    exhausted = False
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _whitespace:
+            pos += 1
+
+        need_more = pos >= len(buffer)
+        if not need_more:
+            char = buffer[pos]
+            if state == 'start':
+                if char != '[':
+                    raise ValueError("Expected a JSON array, found %r" % char)
+                pos += 1
+                state = 'first'
+                continue
+            elif state == 'separator':
+                if char == ',':
+                    pos += 1
+                    state = 'value'
+                elif char == ']':
+                    _expect_end(buffer[pos + 1:], chunks)
+                    return
+                else:
+                    raise ValueError("Expected ',' or ']' at position %d, found %r" % (pos, char))
+                continue
+            elif state == 'first' and char == ']':
+                _expect_end(buffer[pos + 1:], chunks)
+                return
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    if exhausted:
+                        raise
+                    need_more = True
+                else:
+                    # a number or literal may continue in the next chunk until a delimiter follows it
+                    complete = char in '{["' or (end < len(buffer) and buffer[end] in _whitespace + ',]')
+                    if complete or exhausted:
+                        yield item
+                        pos = end
+                        state = 'separator'
+                        continue
+                    need_more = True
+
+        if need_more:
+            if exhausted:
+                raise ValueError("Unexpected end of JSON array")
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                exhausted = True
+                continue
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+
+def load_json_stream(chunks, encoding='utf-8'):
+    """
+    Decode a JSON document from an iterable of bytes or text chunks.
+
+    Top-level arrays are decoded element by element with iter_json_array,
+    anything else is decoded in one go. Returns None for an empty body.
+    """
+    chunks = iter_text(chunks, encoding)
+    head = ''
+    for chunk in chunks:
+        head += chunk
+        if head.strip():
+            break
+
+    if not head.strip():
+        return None
+    if head.lstrip().startswith('['):
+        return list(iter_json_array(itertools.chain([head], chunks)))
+    return codec.loads(head + ''.join(chunks))
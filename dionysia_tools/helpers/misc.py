@@ -2,12 +2,6 @@ from ..utils.log import logger
 log = logger.get_logger(__name__)
 
 
-def backoff_handler(details):
-    log.warning("Backing off {wait:0.1f} seconds afters {tries} tries "
-                "calling function {target} with args {args} and kwargs "
-                "{kwargs}".format(**details))
-
-
 def dict_merge(dct, merge_dct):
     for k, v in merge_dct.items():
         import collections
@@ -29,3 +23,50 @@ def ensure_endswith(data, endswith_key):
         return "%s%s" % (data.strip(), endswith_key)
     else:
         return data
+
+
+def project(item, fields):
+    """Copy of item keeping only the dotted paths in fields, i.e. ['movie.title', 'movie.ids.imdb']"""
+    projected = {}
+    for field in fields:
+        keys = field.split('.')
+        source, target = item, projected
+        for key in keys[:-1]:
+            if not isinstance(source, dict) or key not in source:
+                break
+            source = source[key]
+            target = target.setdefault(key, {})
+        else:
+            if isinstance(source, dict) and keys[-1] in source:
+                target[keys[-1]] = source[keys[-1]]
+    return projected
+
+
+def fingerprint(values):
+    """Order independent digest of values, i.e. the ids of a feed"""
+    import hashlib
+
+    return hashlib.sha1('\n'.join(sorted(str(v) for v in values)).encode('utf-8')).hexdigest()
+
+
+def cache_by_arguments(**options):
+    """
+    cashier's cache keyed on every argument of the call. cashier keys on the
+    positional arguments alone, so keyword arguments are bound to their
+    positions, defaults included, before the cached call.
+    """
+    import functools
+    import inspect
+    from cashier import cache
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        cached = cache(**options)(fn)
+
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return cached(*bound.args, **bound.kwargs)
+        return wrapped
+    return decorator
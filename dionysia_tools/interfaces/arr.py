@@ -1,24 +1,24 @@
 import os.path
-import backoff
-import requests
 
 from abc import ABC, abstractmethod
 from cashier import cache
+from ..helpers import codec
 from ..helpers.misc import (
-    backoff_handler,
     ensure_endswith,
     dict_merge,
     number_suffix
     )
+from ..utils.breaker import CircuitOpenError
 from ..utils.log import logger
 from ..utils.config import Config
+from ..utils.transport import transport
 
 log = logger.get_logger(__name__)
 cachefile = Config().cachefile
 
 
 class ARR:
-    def __init__(self, server_url, api_key):
+    def __init__(self, server_url, api_key, service='arr'):
         self.server_url = server_url
         self.api_key = api_key
         self.headers = {
@@ -28,23 +28,23 @@ class ARR:
             'X-Api-Key': self.api_key,
             'Connection': 'Keep-Alive',
         }
+        transport.register(self.server_url, headers=self.headers, timeout=60, service=service)
 
     def validate_api_key(self):
         try:
             # request system status to validate api_key
-            req = requests.get(
-                os.path.join(ensure_endswith(self.server_url, '/'), '/system/status'),
-                self.server_url + '/system/status',
-                headers=self.headers,
-                timeout=60,
+            req = transport.get(
+                os.path.join(ensure_endswith(self.server_url, '/'), 'system/status'),
                 allow_redirects=False
             )
             log.debug("Request %s URL: %s", 'GET', req.url)
             log.debug("Response Code: %d", req.status_code)
 
-            if req.status_code == 200 and 'version' in req.json():
+            if req.status_code == 200 and 'version' in codec.loads(req.content):
                 return True
             return False
+        except CircuitOpenError:
+            raise
         except Exception:
             log.exception("Exception validating api_key: ")
         return False
@@ -53,44 +53,41 @@ class ARR:
     def get_objects(self):
         pass
 
-    @backoff.on_predicate(backoff.expo, lambda x: x is None, max_tries=4, on_backoff=backoff_handler)
     def _get_objects(self, endpoint):
         try:
-            # make request
-            req = requests.get(
+            # make request, large libraries are decoded object by object as they stream in
+            req, resp_json = transport.fetch(
+                'get',
                 os.path.join(ensure_endswith(self.server_url, '/'), endpoint),
-                headers=self.headers,
-                timeout=60,
+                incremental=True,
                 allow_redirects=False
             )
             log.debug("Request URL: %s", req.url)
             log.debug("Request Response: %d", req.status_code)
 
             if req.status_code == 200:
-                resp_json = req.json()
                 log.debug("Found %d objects", len(resp_json))
                 return resp_json
             else:
                 log.error("Failed to retrieve all objects, request response: %d", req.status_code)
+        except CircuitOpenError:
+            raise
         except Exception:
             log.exception("Exception retrieving objects: ")
         return None
 
-    @backoff.on_predicate(backoff.expo, lambda x: x is None, max_tries=4, on_backoff=backoff_handler)
     def get_quality_profile_id(self, profile_name):
         try:
             # make request
-            req = requests.get(
+            req = transport.get(
                 os.path.join(ensure_endswith(self.server_url, '/'), 'profile'),
-                headers=self.headers,
-                timeout=60,
                 allow_redirects=False
             )
             log.debug("Request URL: %s", req.url)
             log.debug("Request Response: %d", req.status_code)
 
             if req.status_code == 200:
-                resp_json = req.json()
+                resp_json = codec.loads(req.content)
                 for profile in resp_json:
                     if profile['name'].lower() == profile_name.lower():
                         log.debug("Found Quality Profile ID for \'%s\': %d", profile_name, profile['id'])
@@ -99,47 +96,46 @@ class ARR:
                               profile['id'], profile_name)
             else:
                 log.error("Failed to retrieve all quality profiles, request response: %d", req.status_code)
+        except CircuitOpenError:
+            raise
         except Exception:
             log.exception("Exception retrieving ID of quality profile %s: ", profile_name)
         return None
 
-    @backoff.on_exception(backoff.expo, requests.exceptions.RequestException, max_tries=4, on_backoff=backoff_handler)
     def get_language_profile_id(self, language_name):
         try:
             # check if sonarr is v3
 
             # make request
-            ver_req = requests.get(
+            ver_req = transport.get(
                 os.path.join(ensure_endswith(self.server_url, '/'), 'system/status'),
-                headers=self.headers,
-                timeout=60,
                 allow_redirects=False
             )
 
             if ver_req.status_code == 200:
-                ver_resp_json = ver_req.json()
+                ver_resp_json = codec.loads(ver_req.content)
                 if not Version(ver_resp_json['version']) > Version('3'):
                     log.debug("Skipping Language Profile lookup because Sonarr version is \'%s\'.",
                               ver_resp_json['version'])
                     return None
 
+        except CircuitOpenError:
+            raise
         except Exception:
             log.exception("Exception verifying Sonarr version.")
             return None
 
         try:
             # make request
-            req = requests.get(
+            req = transport.get(
                 os.path.join(ensure_endswith(self.server_url, '/'), 'languageprofile'),
-                headers=self.headers,
-                timeout=60,
                 allow_redirects=False
             )
             log.debug("Request URL: %s", req.url)
             log.debug("Request Response: %d", req.status_code)
 
             if req.status_code == 200:
-                resp_json = req.json()
+                resp_json = codec.loads(req.content)
                 for profile in resp_json:
                     if profile['name'].lower() == language_name.lower():
                         log.debug("Found Language Profile ID for \'%s\': %d", language_name, profile['id'])
@@ -148,6 +144,8 @@ class ARR:
                               profile['id'], language_name)
             else:
                 log.error("Failed to retrieve all language profiles, request response: %d", req.status_code)
+        except CircuitOpenError:
+            raise
         except Exception:
             log.exception("Exception retrieving ID of language profile %s: ", language_name)
         return None
@@ -166,15 +164,12 @@ class ARR:
             }
         }
 
-    @backoff.on_predicate(backoff.expo, lambda x: x is None, max_tries=4, on_backoff=backoff_handler)
     def _add_object(self, endpoint, payload, identifier_field, identifier):
         try:
             # make request
-            req = requests.post(
+            req = transport.post(
                 os.path.join(ensure_endswith(self.server_url, '/'), endpoint),
-                headers=self.headers,
                 json=payload,
-                timeout=60,
                 allow_redirects=False
             )
             log.debug("Request URL: %s", req.url)
@@ -184,7 +179,7 @@ class ARR:
 
             response_json = None
             if 'json' in req.headers['Content-Type'].lower():
-                response_json = misc.get_response_dict(req.json(), identifier_field, identifier)
+                response_json = misc.get_response_dict(codec.loads(req.content), identifier_field, identifier)
 
             if (req.status_code == 201 or req.status_code == 200) \
                     and (response_json and identifier_field in response_json) \
@@ -201,6 +196,8 @@ class ARR:
                 log.error("Failed to add \'%s [%d]\', unexpected response:\n%s",
                           payload['title'], identifier, req.text)
                 return False
+        except CircuitOpenError:
+            raise
         except Exception:
             log.exception("Exception adding \'%s [%d]\': ", payload['title'], identifier)
         return None
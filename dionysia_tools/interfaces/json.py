@@ -1,11 +1,9 @@
-import backoff
-import json
-import requests
-
 from cashier import cache
-from ..helpers.misc import (backoff_handler, dict_merge, number_suffix)
+from ..helpers.misc import (dict_merge, number_suffix)
+from ..utils.breaker import CircuitOpenError
 from ..utils.log import logger
 from ..utils.config import Config
+from ..utils.transport import transport
 
 log = logger.get_logger(__name__)
 cachefile = Config().cachefile
@@ -29,39 +27,30 @@ class JSONList:
             payload = {}
 
         # make request
-        resp_data = b''
-        if request_type == 'delete':
-            with requests.delete(url, headers=headers, params=payload, timeout=30, stream=True) as req:
-                for chunk in req.iter_content(chunk_size=250000, decode_unicode=True):
-                    if chunk:
-                        resp_data += chunk
-        else:
-            with requests.get(url, headers=headers, params=payload, timeout=30, stream=True) as req:
-                for chunk in req.iter_content(chunk_size=250000, decode_unicode=False):
-                    if chunk:
-                        resp_data += chunk
+        transport.register(url, service='json {}'.format(transport.host(url)))
+        req, resp_json = transport.fetch(request_type, url, revalidate=True, headers=headers, params=payload)
 
         log.debug("Request URL: %s", req.url)
         log.debug("Request Payload: %s", payload)
         log.debug("Response Code: %d", req.status_code)
-        return req, resp_data
+        return req, resp_json
 
-    @backoff.on_predicate(backoff.expo, lambda x: x is None, max_tries=4, on_backoff=backoff_handler)
     def _make_item_request(self, url, object_name, payload=None):
 
         if payload is None:
             payload = {}
 
         try:
-            req, resp_data = self._make_request(url, payload)
+            req, resp_json = self._make_request(url, payload)
 
-            if req.status_code == 200 and len(resp_data):
+            if req.status_code == 200 and resp_json is not None:
                 log.info("Retrieved %s", object_name)
-                resp_json = json.loads(resp_data.decode())
                 return resp_json
             else:
                 log.error("Failed to retrieve %s, request response: %d", object_name, req.status_code)
                 return None
+        except CircuitOpenError:
+            raise
         except Exception:
             log.exception("Exception retrieving %s: ", object_name)
         return None
@@ -71,4 +60,5 @@ class JSONList:
 
     @cache(cache_file=cachefile, cache_time=3600, retry_if_blank=True)
     def get_list_imdb(self, url, list_name):
-        return [i['imdb_id'] for i in self.get_list(url, list_name)]
+        list_items = self.get_list(url, list_name)
+        return [i['imdb_id'] for i in list_items] if list_items is not None else None
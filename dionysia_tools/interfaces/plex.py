@@ -1,26 +1,43 @@
+import contextlib
 import datetime
-import requests
+import time
+import xml.etree.ElementTree as ElementTree
 
+from concurrent.futures import ThreadPoolExecutor
 from plexapi.server import PlexServer, CONFIG
 from cashier import cache
+from .plex_index import IndexStore, LibraryIndex, decode_video, watermark
 from ..utils.log import logger
 from ..utils.config import Config
+from ..utils.transport import transport
 
 log = logger.get_logger(__name__)
 cachefile = Config().cachefile
 
 
 class Plex:
+    # rating keys per section-level edit, keeps the request line well under server limits
+    edit_batch_size = 200
 
     def __init__(self, cfg):
         self.cfg = cfg
+        self.breaker = transport.breaker('plex')
         self.plex = self.get_plex()
+        self._section_keys = {}
+        self._indexes = {}
+        self.index_store = IndexStore()
+        # section -> (rating keys changed, rating keys removed) since the index was last saved
+        self._unsaved = {}
+        # (section, ratingKey) -> (record, collections before the run) while changes are buffered
+        self._changes = None
 
     def get_plex(self):
         url = self.cfg['plex']['url']
         token = self.cfg['plex']['token']
 
-        session = requests.Session()
+        # the token goes in a header so it never shows up in a logged request URL
+        transport.register(url, headers={'X-Plex-Token': token}, service='plex')
+        session = transport.session(url)
         # Ignore verifying the SSL certificate
         session.verify = False  # '/path/to/certfile'
         # If verify is set to a path to a directory,
@@ -31,82 +48,339 @@ class Plex:
             import urllib3
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-        return PlexServer(url, token, session)
-
-    def add_tag(self, video, tag, key='collections'):
-        video.reload()
-        current_tags = [t.tag for t in getattr(video, key)]
-        if tag not in current_tags:
-            params = {
-                "collection[{}].tag.tag".format(len(current_tags)): tag
-            }
-            video.edit(**params)
-            log.info("Updated %s with the following '%s'", video, params)
-            video.reload()
-
-    def remove_tag(self, video, tag, key='collections'):
-        params = {
-            "collection[].tag.tag-": tag
-        }
-        video.edit(**params)
-        log.info("Updated %s with the following '%s'", video, params)
-        video.reload()
+        with self.breaker:
+            return PlexServer(url, token, session)
 
-    def update_addedAt(self, video, addedAt=None):
-        if not addedAt:
-            addedAt = datetime.datetime.now()
-        params = {
-            'addedAt.value': addedAt.strftime('%Y-%m-%d %H:%M:%S'),
+    ############################################################
+    # Library Index
+    ############################################################
+
+    def _section_key(self, section):
+        if section not in self._section_keys:
+            with self.breaker:
+                self._section_keys[section] = self.plex.library.section(section).key
+        return self._section_keys[section]
+
+    def _get_section_page(self, url, params, start, size):
+        """Total size of the listing and the records of one page of it, decoded in the scanning thread"""
+        headers = {
+            'Accept': 'application/xml',
+            'X-Plex-Container-Start': str(start),
+            'X-Plex-Container-Size': str(size),
         }
-        video.edit(**params)
-        log.info("Updated %s with the following '%s'", video, params)
-        video.reload()
-
-    def get_movie(self, section, title, year):
-        section = self.plex.library.section(section)
-        movies = section.search(title=title, year=year)
-
-        log.debug("Searched Plex for %s (%s) and found the following %s", title, year, movies)
-        for movie in movies:
-            if movie.title == title and movie.year == year:
-                return movie
+        req = transport.get(url, params=params, headers=headers)
+        log.debug("Request URL: %s (%d-%d)", req.url, start, start + size)
+        log.debug("Request Response: %d", req.status_code)
+        req.raise_for_status()
+        container = ElementTree.fromstring(req.content)
+        total = int(container.get('totalSize') or container.get('size') or 0)
+        return total, [decode_video(element) for element in container.iter('Video')]
+
+    def _get_section_records(self, section, filters=None):
+        """
+        Compact records of the movies in section matching filters. The first
+        page tells the size of the listing, the other pages are then fetched
+        scan_workers at a time.
+        """
+        url = "{}/library/sections/{}/all".format(self.cfg['plex']['url'].rstrip('/'), self._section_key(section))
+        params = {'type': 1, 'includeGuids': 1}
+        params.update(filters or {})
+        size = self.cfg['plex']['scan_page_size']
+
+        total, records = self._get_section_page(url, params, 0, size)
+        starts = range(size, total, size)
+        if starts:
+            log.debug("Scanning %d more page(s) of the %s library", len(starts), section)
+            with ThreadPoolExecutor(max_workers=self.cfg['plex']['scan_workers'] or 1) as executor:
+                for _, page in executor.map(lambda start: self._get_section_page(url, params, start, size), starts):
+                    records.extend(page)
+        return records
+
+    def get_index(self, section):
+        """
+        Index of the movies in section, loaded once per run. The stored index
+        is refreshed with the movies updated or added since its last sync, and
+        rebuilt from a full scan every index_full_sync seconds to drop deleted
+        movies.
+        """
+        if section in self._indexes:
+            return self._indexes[section]
+
+        section_id = self._index_id(section)
+        state = self.index_store.state(section_id)
+        if state is None or time.time() - state['full_at'] > self.cfg['plex']['index_full_sync']:
+            records = self._get_section_records(section)
+            self.index_store.replace(section_id, records, {'full_at': time.time(), 'watermark': watermark(records)})
+            index = LibraryIndex(records)
+            log.info("Indexed %d movies of the %s library", len(index), section)
         else:
-            return None
+            index = LibraryIndex(self.index_store.records(section_id))
+            changed = {}
+            for field in ('updatedAt', 'addedAt'):
+                for record in self._get_section_records(section, {field + '>>': state['watermark']}):
+                    changed[record['ratingKey']] = record
+            for record in changed.values():
+                index.add(record)
+            state['watermark'] = watermark(changed.values(), state['watermark'])
+            self.index_store.update(section_id, changed.values(), state)
+            log.info("Refreshed %d of %d indexed movies of the %s library", len(changed), len(index), section)
 
-    def get_movie_then_push_addedAt(self, section, title, year, timedelta_minutes=240):
+        self._indexes[section] = index
+        return index
+
+    def _index_id(self, section):
+        return "{}/{}".format(self.cfg['plex']['url'].rstrip('/'), self._section_key(section))
+
+    def _touch(self, section, records):
+        changed, removed = self._unsaved.setdefault(section, (set(), set()))
+        for record in records:
+            changed.add(record['ratingKey'])
+            removed.discard(record['ratingKey'])
+
+    def _forget(self, section, rating_key):
+        self.get_index(section).remove(rating_key)
+        changed, removed = self._unsaved.setdefault(section, (set(), set()))
+        changed.discard(rating_key)
+        removed.add(rating_key)
+
+    def save_index(self):
+        """Store the records edited and the movies found deleted since the indexes were loaded"""
+        for section, (changed, removed) in self._unsaved.items():
+            index = self._indexes[section]
+            self.index_store.write(self._index_id(section), [index.records[key] for key in changed], removed)
+            log.debug("Saved %d changed and %d removed movie(s) of the %s index", len(changed), len(removed),
+                      section)
+        self._unsaved = {}
+
+    def match_movie(self, section, title, year, ids=None):
+        """Index record of a movie, None when the library does not have it"""
+        record = self.get_index(section).match(title, year, ids)
+        log.debug("Matched %s (%s) to %s", title, year, record and record['ratingKey'])
+        return record
+
+    def get_movie_then_push_addedAt(self, section, title, year, timedelta_minutes=240, ids=None):
         addedAt = datetime.datetime.now()
         addedAt += datetime.timedelta(minutes=-timedelta_minutes)
-        movie = self.get_movie(section, title, year)
-        if movie and movie.media[0].videoResolution in ['1080', '4K']:
-            self.add_tag(movie, 'Trakt Trending', 'collections')
-            self.update_addedAt(movie, addedAt)
-
-    def get_collection(self, section, collection):
-        section = self.plex.library.section(section)
-        videos = section.search(collection=collection)
-        log.debug("Searched for '%s' Collection and found %s videos", collection, len(videos))
-        return videos
-
-    def update_collection(self, section, list_of_titles_years, collection_name, stage=False):
-        list_collection = []
+        record = self.match_movie(section, title, year, ids)
+        if record and (record['resolution'] or '').lower() in ['1080', '4k']:
+            self.add_collection(section, [record], 'Trakt Trending')
+            self.push_addedAt(section, [record], addedAt)
+
+    ############################################################
+    # Bulk Edits
+    ############################################################
+
+    def _put_edit(self, section, rating_keys, params):
+        url = "{}/library/sections/{}/all".format(self.cfg['plex']['url'].rstrip('/'), self._section_key(section))
+        query = {'type': 1, 'id': ','.join(str(key) for key in rating_keys)}
+        query.update(params)
+        req = transport.put(url, params=query)
+        log.debug("Request URL: %s", req.url)
+        log.debug("Request Response: %d", req.status_code)
+        return req.ok
+
+    def batch_edit(self, section, records, params):
+        """
+        Apply the same edit to every record with one section-level request per
+        edit_batch_size movies. Movies of a batch Plex rejects are edited one
+        by one. Returns the records that were edited.
+        """
+        edited = []
+        records = list(records)
+        for i in range(0, len(records), self.edit_batch_size):
+            batch = records[i:i + self.edit_batch_size]
+            if self._put_edit(section, [record['ratingKey'] for record in batch], params):
+                edited.extend(batch)
+                continue
+            log.warning("Plex rejected editing %d movies at once, editing them one by one", len(batch))
+            for record in batch:
+                if self._put_edit(section, [record['ratingKey']], params):
+                    edited.append(record)
+                else:
+                    log.error("Failed to update %s (%s) with the following '%s'", record['title'], record['year'],
+                              params)
+        if edited:
+            log.info("Updated %d movie(s) with the following '%s'", len(edited), params)
+        return edited
+
+    def verify(self, section, records):
+        """
+        Check the collections tracked in records against Plex with one
+        /library/metadata/{keys} query per edit_batch_size movies, taking
+        Plex's state where they differ. Returns the records that differed.
+        """
+        differ = []
+        records = list(records)
+        for i in range(0, len(records), self.edit_batch_size):
+            batch = records[i:i + self.edit_batch_size]
+            url = "{}/library/metadata/{}".format(self.cfg['plex']['url'].rstrip('/'),
+                                                  ','.join(str(record['ratingKey']) for record in batch))
+            req = transport.get(url, headers={'Accept': 'application/xml'})
+            log.debug("Request URL: %s", req.url)
+            log.debug("Request Response: %d", req.status_code)
+            if not req.ok:
+                log.warning("Could not verify %d edited movie(s), request response: %d", len(batch), req.status_code)
+                continue
+
+            actual = {}
+            for element in ElementTree.fromstring(req.content).iter('Video'):
+                actual[int(element.get('ratingKey'))] = decode_video(element)
+            for record in batch:
+                current = actual.get(record['ratingKey'])
+                if current is None:
+                    log.warning("%s (%s) is no longer in Plex", record['title'], record['year'])
+                    self._forget(section, record['ratingKey'])
+                    differ.append(record)
+                    continue
+                record['addedAt'], record['updatedAt'] = current['addedAt'], current['updatedAt']
+                self._touch(section, [record])
+                if set(current['collections']) != set(record['collections']):
+                    log.warning("%s (%s) is in the collections %s, expected %s", record['title'], record['year'],
+                                current['collections'], record['collections'])
+                    record['collections'][:] = current['collections']
+                    differ.append(record)
+        log.debug("Verified %d edited movie(s), %d differed", len(records), len(differ))
+        return differ
+
+    def add_collection(self, section, records, collection_name):
+        """Add records to a collection, grouped by how many collections they already have"""
+        if self._changes is not None:
+            for record in records:
+                self._queue_change(section, record, collection_name, add=True)
+            return
+
+        groups = {}
+        for record in records:
+            if collection_name not in record['collections']:
+                groups.setdefault(len(record['collections']), []).append(record)
+
+        edited = []
+        for position, group in groups.items():
+            params = {"collection[{}].tag.tag".format(position): collection_name}
+            for record in self.batch_edit(section, group, params):
+                record['collections'].append(collection_name)
+                edited.append(record)
+        self.verify(section, edited)
+
+    def remove_collection(self, section, records, collection_name):
+        if self._changes is not None:
+            for record in records:
+                self._queue_change(section, record, collection_name, add=False)
+            return
+
+        params = {"collection[].tag.tag-": collection_name}
+        edited = self.batch_edit(section, records, params)
+        for record in edited:
+            if collection_name in record['collections']:
+                record['collections'].remove(collection_name)
+        self.verify(section, edited)
+
+    ############################################################
+    # Change Buffer
+    ############################################################
+
+    @contextlib.contextmanager
+    def buffered(self):
+        """
+        Collect every collection change made inside the block and write them
+        when it ends, one edit per movie holding all of its changes. Movies
+        ending up with the same edit share one bulk request. Nothing is
+        written if the block raises.
+        """
+        self._changes = {}
+        try:
+            yield self
+            changes = self._changes
+        finally:
+            self._changes = None
+        self._flush_changes(changes)
+
+    def _queue_change(self, section, record, collection_name, add):
+        key = (section, record['ratingKey'])
+        if key not in self._changes:
+            self._changes[key] = (record, list(record['collections']))
+        # the record shows the pending state so later lists diff against it
+        if add and collection_name not in record['collections']:
+            record['collections'].append(collection_name)
+        elif not add and collection_name in record['collections']:
+            record['collections'].remove(collection_name)
+
+    def _flush_changes(self, changes):
+        edits = {}
+        for (section, _), (record, original) in changes.items():
+            added = [name for name in record['collections'] if name not in original]
+            removed = [name for name in original if name not in record['collections']]
+            if not added and not removed:
+                continue
+            params = {"collection[{}].tag.tag".format(len(original) + i): name for i, name in enumerate(added)}
+            if removed:
+                params["collection[].tag.tag-"] = ','.join(removed)
+            edit = edits.setdefault((section, tuple(sorted(params.items()))), (params, []))
+            edit[1].append((record, original))
+
+        log.info("Writing the collection changes of %d movie(s) in %d edit(s)",
+                 sum(len(entries) for _, entries in edits.values()), len(edits))
+        edited = {}
+        for (section, _), (params, entries) in edits.items():
+            keys = {record['ratingKey'] for record in self.batch_edit(section, [r for r, _ in entries], params)}
+            for record, original in entries:
+                if record['ratingKey'] in keys:
+                    edited.setdefault(section, []).append(record)
+                else:
+                    record['collections'][:] = original
+        for section, records in edited.items():
+            self.verify(section, records)
+
+    def push_addedAt(self, section, records, addedAt=None):
+        if not addedAt:
+            addedAt = datetime.datetime.now()
+        edited = self.batch_edit(section, records, {'addedAt.value': addedAt.strftime('%Y-%m-%d %H:%M:%S')})
+        for record in edited:
+            record['addedAt'] = int(time.mktime(addedAt.timetuple()))
+        self._touch(section, edited)
+
+    def match_collection(self, section, list_of_titles_years):
+        """Index records of the list entries found in section by rating key, consuming the entries as they come"""
+        current_year = datetime.datetime.now().year
+        list_collection = {}
         for list_movie in list_of_titles_years:
-            current_year = datetime.datetime.now().year
-            movie = self.get_movie(section, list_movie['title'], list_movie['year'] or current_year)
-            if movie:
-                list_collection.append(movie)
+            record = self.match_movie(section, list_movie['title'], list_movie['year'] or current_year,
+                                      list_movie.get('ids'))
+            if record:
+                list_collection[record['ratingKey']] = record
+        return list_collection
 
-        plex_collection = self.get_collection(section, collection_name)
+    def reconcile_collections(self, section, collections, stage=False):
+        """
+        Bring every collection in collections ({name: records from
+        match_collection}) in line with its list in one pass over the section
+        index, so the reads stay the same however many collections there are.
+        """
+        wanted = {}
+        for name, records in collections.items():
+            for key in records:
+                wanted.setdefault(key, set()).add(name)
 
-        remove_collection = set(plex_collection) - set(list_collection)
-        for video in remove_collection:
-            if stage:
-                log.info("STAGING: %s, will REMOVE %s", video, collection_name)
-            else:
-                self.remove_tag(video, collection_name, 'collections')
+        names = set(collections)
+        adds = {name: [] for name in names}
+        removes = {name: [] for name in names}
+        for key, record in self.get_index(section).records.items():
+            current = names.intersection(record['collections'])
+            target = wanted.get(key, set())
+            for name in current - target:
+                removes[name].append(record)
+            for name in target - current:
+                adds[name].append(record)
 
-        add_collection = set(list_collection) - set(plex_collection)
-        for video in add_collection:
+        for name in sorted(names):
             if stage:
-                log.info("STAGING: %s, will ADD %s", video, collection_name)
-            else:
-                self.add_tag(video, collection_name, 'collections')
+                for record in removes[name]:
+                    log.info("STAGING: %s (%s), will REMOVE %s", record['title'], record['year'], name)
+                for record in adds[name]:
+                    log.info("STAGING: %s (%s), will ADD %s", record['title'], record['year'], name)
+                continue
+            if removes[name]:
+                self.remove_collection(section, removes[name], name)
+            if adds[name]:
+                self.add_collection(section, adds[name], name)
+            log.debug("Collection %s: %d to add, %d to remove", name, len(adds[name]), len(removes[name]))
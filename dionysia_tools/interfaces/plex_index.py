@@ -0,0 +1,126 @@
+import re
+import unicodedata
+
+from ..utils.log import logger
+from ..utils.store import Store
+
+log = logger.get_logger(__name__)
+
+# agents of the ids list entries carry, and the scheme Plex uses for them in Guid tags
+guid_schemes = {'imdb': 'imdb', 'tmdb': 'tmdb', 'tvdb': 'tvdb'}
+
+
+def normalize_title(title):
+    """Title folded for matching, without case, accents, punctuation or repeated spaces"""
+    title = unicodedata.normalize('NFKD', title or '')
+    title = ''.join(c for c in title if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^\w]+', ' ', title.lower()).split())
+
+
+def decode_video(element):
+    """Compact record of a <Video> element of a section listing"""
+    media = element.find('Media')
+    year = element.get('year')
+    guids = [guid.get('id') for guid in element.findall('Guid')]
+    if element.get('guid'):
+        guids.append(element.get('guid'))
+    return {
+        'ratingKey': int(element.get('ratingKey')),
+        'title': element.get('title'),
+        'year': int(year) if year else None,
+        'guids': guids,
+        'resolution': media.get('videoResolution') if media is not None else None,
+        'collections': [collection.get('tag') for collection in element.findall('Collection')],
+        'addedAt': int(element.get('addedAt') or 0),
+        'updatedAt': int(element.get('updatedAt') or 0),
+    }
+
+
+class LibraryIndex:
+    """
+    Compact records of every movie in a Plex section, keyed by rating key and
+    looked up by normalized (title, year) or by IMDb/TMDb/TVDb guid, so list
+    entries can be matched without a search request each.
+    """
+
+    def __init__(self, records=()):
+        self.records = {}
+        self._titles = {}
+        self._guids = {}
+        for record in records:
+            self.add(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, record):
+        self.remove(record['ratingKey'])
+        self.records[record['ratingKey']] = record
+        self._titles.setdefault((normalize_title(record['title']), record['year']), []).append(record['ratingKey'])
+        for guid in record['guids']:
+            self._guids[guid] = record['ratingKey']
+
+    def remove(self, rating_key):
+        record = self.records.pop(rating_key, None)
+        if record is None:
+            return
+        keys = self._titles.get((normalize_title(record['title']), record['year']), [])
+        if rating_key in keys:
+            keys.remove(rating_key)
+        for guid in record['guids']:
+            if self._guids.get(guid) == rating_key:
+                del self._guids[guid]
+
+    def match(self, title=None, year=None, ids=None):
+        """Record of the movie with one of ids, or else with title and year, None when there is none"""
+        for agent, value in (ids or {}).items():
+            if agent in guid_schemes and value:
+                rating_key = self._guids.get("{}://{}".format(guid_schemes[agent], value))
+                if rating_key is not None:
+                    return self.records[rating_key]
+
+        keys = self._titles.get((normalize_title(title), year))
+        return self.records[keys[0]] if keys else None
+
+    def collection(self, name):
+        return [record for record in self.records.values() if name in record['collections']]
+
+
+def watermark(records, current=0):
+    """Newest updatedAt or addedAt of records, on the Plex server's clock"""
+    for record in records:
+        current = max(current, record['updatedAt'], record['addedAt'])
+    return current
+
+
+class IndexStore:
+    """
+    Section indexes kept in the store between runs, one row per record plus a
+    state row holding the watermark of the last sync and the time of the last
+    full scan.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or Store('plex_index')
+
+    def state(self, section_id):
+        return self.store.get("state:{}".format(section_id))
+
+    def records(self, section_id):
+        return [record for _, record in self.store.items("record:{}:".format(section_id))]
+
+    def write(self, section_id, records=(), removed=()):
+        """Store changed records and drop the removed rating keys, leaving the sync state as it is"""
+        self.store.set_many([("record:{}:{}".format(section_id, r['ratingKey']), r) for r in records])
+        self.store.delete_many(["record:{}:{}".format(section_id, key) for key in removed])
+
+    def update(self, section_id, records, state):
+        self.write(section_id, records)
+        self.store.set("state:{}".format(section_id), state)
+
+    def replace(self, section_id, records, state):
+        """Store a full scan, dropping the records of movies no longer in the section"""
+        prefix = "record:{}:".format(section_id)
+        current = {prefix + str(r['ratingKey']) for r in records}
+        self.store.delete_many([key for key in self.store.keys(prefix) if key not in current])
+        self.update(section_id, records, state)
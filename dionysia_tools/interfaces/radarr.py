@@ -1,19 +1,19 @@
 import os.path
-import backoff
 import datetime
 import dateutil.parser
 import dateutil.tz
-import requests
 
 from cashier import cache
 from .arr import ARR
+from ..helpers import codec
 from ..helpers.misc import (
-    backoff_handler,
     dict_merge,
     ensure_endswith,
     number_suffix)
+from ..utils.breaker import CircuitOpenError
 from ..utils.log import logger
 from ..utils.config import Config
+from ..utils.transport import transport
 
 log = logger.get_logger(__name__)
 cachefile = Config().cachefile
@@ -23,7 +23,7 @@ class Radarr(ARR):
 
     def __init__(self, cfg):
         self.cfg = cfg
-        ARR.__init__(self, cfg['radarr']['baseurl'], cfg['radarr']['api_key'])
+        ARR.__init__(self, cfg['radarr']['baseurl'], cfg['radarr']['api_key'], 'radarr')
 
     def get_objects(self):
         return self._get_objects('movie')
@@ -66,17 +66,14 @@ class Radarr(ARR):
             oldest=oldest,
         )
 
-    @backoff.on_predicate(backoff.expo, lambda x: x is None, max_tries=4, on_backoff=backoff_handler)
     def _command(self, endpoint, data=None, params=None, method='get', success_status_code=200):
         try:
             # make request
-            req = requests.request(
+            req = transport.request(
                 method=method,
                 url=os.path.join(ensure_endswith(self.server_url, '/'), endpoint),
-                headers=self.headers,
                 json=data,
                 params=params,
-                timeout=60,
                 allow_redirects=False
             )
             log.debug("Request URL: %s %s", method.upper(), req.url)
@@ -84,10 +81,12 @@ class Radarr(ARR):
             log.debug("Request Response: %d", req.status_code)
 
             if req.status_code == success_status_code:
-                resp_json = req.json()
+                resp_json = codec.loads(req.content)
                 return resp_json
             else:
                 log.error("Failed, request response: %d", req.status_code)
+        except CircuitOpenError:
+            raise
         except Exception:
             log.exception("Exception retrieving objects: ")
         return None
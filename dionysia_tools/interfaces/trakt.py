@@ -1,17 +1,56 @@
-import backoff
-import json
-import requests
+import hashlib
+import threading
 import time
 
-from cashier import cache
-from ..helpers.misc import (backoff_handler, dict_merge, number_suffix)
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from ..helpers import codec
+from ..helpers.misc import (cache_by_arguments, dict_merge, number_suffix, project)
+from ..utils.breaker import CircuitOpenError
+from ..utils.catalog import Catalog
 from ..utils.log import logger
 from ..utils.config import Config
+from ..utils.ratelimit import TokenBucket
+from ..utils.retry import RetryPolicy
+from ..utils.store import Store
+from ..utils.transport import transport
 
 log = logger.get_logger(__name__)
 cachefile = Config().cachefile
 
 
+class TraktError(Exception):
+    pass
+
+
+def _in_range(value, bounds):
+    """Whether value falls in a Trakt range filter such as '1990-1999' or '2019'"""
+    if value is None:
+        return False
+    low, _, high = str(bounds).partition('-')
+    return int(low) <= value <= int(high or low)
+
+
+def matches_filters(item, filters):
+    """
+    Whether the extended=full object of item passes filters, which take the
+    same years, runtimes, genres, languages and countries values as the list
+    methods so Trakt's own filtering can be done locally.
+    """
+    obj = item.get('movie') or item.get('show') or item
+    if filters.get('years') and not _in_range(obj.get('year'), filters['years']):
+        return False
+    if filters.get('runtimes') and not _in_range(obj.get('runtime'), filters['runtimes']):
+        return False
+    if filters.get('genres') and not {g.lower() for g in filters['genres']} & set(obj.get('genres') or []):
+        return False
+    if filters.get('languages') and (obj.get('language') or '') not in [l.lower() for l in filters['languages']]:
+        return False
+    if filters.get('countries') and (obj.get('country') or '') not in [c.lower() for c in filters['countries']]:
+        return False
+    return True
+
+
 def extract_list_user_and_key_from_url(list_url):
     try:
         import re
@@ -26,15 +65,43 @@ def extract_list_user_and_key_from_url(list_url):
 
 class Trakt:
     non_user_lists = ['anticipated', 'trending', 'popular', 'boxoffice', 'watched', 'played']
+    config_keys = ['client_id', 'client_secret', 'baseurl', 'rate_limit', 'write_rate_limit', 'page_workers',
+                   'token_refresh_margin', 'write_chunk_size', 'write_workers', 'write_retries', 'list_workers',
+                   'catalog_ttl']
+    # extended levels a caller can ask for and the value sent to Trakt for them
+    extended_levels = {'ids': None, 'min': None, 'full': 'full'}
+    # authentication headers per (client_id, user), shared by every instance and thread until the token expires
+    _auth_headers = {}
+    _auth_lock = threading.Lock()
+    # lookups made once per run, per client_id, off the instance so the pickled self in cache keys stays the same
+    _first_users = {}
+    _lists_updated_at = {}
 
     def __init__(self, cfg):
         self.cfg = cfg
+        self.list_state = Store('trakt_lists')
+        self.catalog = Catalog(self.cfg.trakt.catalog_ttl)
+        transport.register(self.cfg.trakt.baseurl, timeout=30, service='trakt')
+
+    def limiter(self, user=None, write=False):
+        """
+        Rate budget for requests made as user, Trakt counts authenticated calls
+        per user and holds POST, PUT and DELETE calls to a much lower rate.
+        """
+        name = self.cfg.trakt.client_id if user is None else "{}:{}".format(self.cfg.trakt.client_id, user)
+        rate_limit = self.cfg.trakt.write_rate_limit if write else self.cfg.trakt.rate_limit
+        return TokenBucket.get(
+            name + ':write' if write else name,
+            calls=rate_limit.calls,
+            period=rate_limit.period,
+            capacity=rate_limit.burst,
+        )
 
     ############################################################
     # Requests
     ############################################################
 
-    def _make_request(self, url, payload=None, authenticate_user=None, data=None, request_type='get'):
+    def _make_request(self, url, payload=None, authenticate_user=None, data=None, request_type='get', retry=True):
         headers, authenticate_user = self._headers(authenticate_user)
         headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 ' \
                                 '(KHTML, like Gecko) Chrome/71.0.3578.80 Safari/537.36'
@@ -46,46 +113,33 @@ class Trakt:
             url = url.replace('{authenticate_user}', authenticate_user)
 
         # make request
-        resp_data = ''
-        if request_type == 'delete':
-            with requests.delete(url, headers=headers, params=payload, timeout=30, stream=True) as req:
-                for chunk in req.iter_content(chunk_size=250000, decode_unicode=True):
-                    if chunk:
-                        resp_data += chunk
-        if request_type == 'post':
-            json_data = json.dumps(data)
-            with requests.post(url, headers=headers, data=json_data, timeout=30, stream=True) as req:
-                for chunk in req.iter_content(chunk_size=250000, decode_unicode=True):
-                    if chunk:
-                        resp_data += chunk
-        else:
-            with requests.get(url, headers=headers, params=payload, timeout=30, stream=True) as req:
-                for chunk in req.iter_content(chunk_size=250000, decode_unicode=True):
-                    if chunk:
-                        resp_data += chunk
+        self.limiter(authenticate_user, write=request_type in ('post', 'put', 'delete')).acquire()
+        json_data = codec.dumps(data) if request_type == 'post' else None
+        # only list endpoints are polled often enough for a stored copy to pay off
+        revalidate = request_type == 'get' and '/lists' in url
+        req, resp_json = transport.fetch(request_type, url, revalidate=revalidate, headers=headers, params=payload,
+                                         data=json_data, retry=retry)
 
         log.debug("Request %s URL: %s", request_type.upper(), req.url)
         log.debug("Request Payload: %s", payload)
         log.debug("Request User: %s", authenticate_user)
         log.debug("Response Code: %d", req.status_code)
-        return req, resp_data
+        return req, resp_json
 
-    @backoff.on_predicate(backoff.expo, lambda x: x is None, max_tries=4, on_backoff=backoff_handler)
-    def _make_item_request(self, url, object_name, payload=None, data=None, request_type='get'):
+    def _make_item_request(self, url, object_name, payload=None, data=None, request_type='get', extended='full',
+                           authenticate_user=None):
 
         if payload is None:
             payload = {}
 
-        payload = dict_merge(payload, {'extended': 'full'})
+        if self.extended_levels[extended]:
+            payload = dict_merge(payload, {'extended': self.extended_levels[extended]})
 
         try:
-            req, resp_data = self._make_request(url, payload, data=data, request_type=request_type)
+            req, resp_json = self._make_request(url, payload, authenticate_user=authenticate_user, data=data,
+                                                request_type=request_type)
 
-            if req.status_code == 200 and len(resp_data):
-                resp_json = json.loads(resp_data)
-                return resp_json
-            elif req.status_code == 201 and len(resp_data):
-                resp_json = json.loads(resp_data)
+            if req.status_code in (200, 201) and resp_json is not None:
                 return resp_json
             elif req.status_code == 401:
                 log.error("The authentication to Trakt is revoked. Please re-authenticate.")
@@ -93,12 +147,13 @@ class Trakt:
             else:
                 log.error("Failed to retrieve %s, request response: %d", object_name, req.status_code)
                 return None
+        except CircuitOpenError:
+            raise
         except Exception:
             log.exception("Exception retrieving %s: ", object_name)
         return None
 
-    @backoff.on_predicate(backoff.expo, lambda x: x is None, max_tries=6, on_backoff=backoff_handler)
-    def _make_items_request(
+    def _iter_items(
             self,
             url,
             limit,
@@ -106,14 +161,21 @@ class Trakt:
             object_name,
             authenticate_user=None,
             payload=None,
-            sleep_between=5,
             years=None,
             countries=None,
             languages=None,
             genres=None,
             runtimes=None,
             include_non_acting_roles=False,
-            pages=None):
+            pages=None,
+            extended='full',
+            fields=None):
+        """
+        Yield the normalized, de-duplicated items of a paged endpoint in page
+        order as each page arrives. The next pages are fetched in the
+        background, a few at a time, while the caller works through the
+        current one. Raises TraktError when a page cannot be retrieved.
+        """
 
         # default payload
         if payload is None:
@@ -125,12 +187,17 @@ class Trakt:
         languages = ','.join(languages).lower()
 
         payload = dict_merge(payload, {
-            'extended': 'full',
             'limit': limit,
             'page': 1,
             'languages': languages,
         })
 
+        # extended level, 'ids' keeps nothing but the ids of each item
+        if self.extended_levels[extended]:
+            payload['extended'] = self.extended_levels[extended]
+        if extended == 'ids' and not fields:
+            fields = [object_name.rstrip('s') + '.ids']
+
         # years range
         if years:
             payload['years'] = years
@@ -147,112 +214,154 @@ class Trakt:
         if runtimes:
             payload['runtimes'] = runtimes
 
-        processed = []
+        seen = set()
 
         if authenticate_user:
             type_name = type_name.replace('{authenticate_user}', self._user_used_for_authentication(authenticate_user))
 
-        try:
-            resp_data = ''
-            while True:
-                attempts = 0
-                max_attempts = 6
-                retrieve_error = False
-                while attempts <= max_attempts:
-                    try:
-                        req, resp_data = self._make_request(url, payload, authenticate_user)
-                        if resp_data is not None:
-                            retrieve_error = False
-                            break
-                        else:
-                            log.warning("Failed to retrieve valid response for Trakt %s %s from _make_item_request",
-                                        type_name, object_name)
-
-                    except Exception:
-                        log.exception("Exception retrieving %s %s in _make_items_request: ", type_name, object_name)
-                        retrieve_error = True
-
-                    attempts += 1
-                    log.info("Sleeping for %d seconds before making attempt %d/%d", 3 * attempts, attempts + 1,
-                             max_attempts)
-                    time.sleep(3 * attempts)
-
-                if retrieve_error or not resp_data or not len(resp_data):
-                    log.error("Failed retrieving %s %s from _make_item_request %d times, aborting...", type_name,
-                              object_name, attempts)
-                    return None
-
-                current_page = payload['page']
-                total_pages = 0 if 'X-Pagination-Page-Count' not in req.headers else int(
-                    req.headers['X-Pagination-Page-Count'])
-
-                log.debug("Response Page: %d of %d", current_page, total_pages)
-
-                if req.status_code == 200 and len(resp_data):
-                    log.info("Retrieved %s %s", type_name, object_name)
-                    if (resp_data.startswith("[{") and resp_data.endswith("}]")) or \
-                            (resp_data.startswith("{") and resp_data.endswith("}")):
-
-                        resp_json = json.loads(resp_data)
-
-                        if type_name == 'person' and 'cast' in resp_json:
-                            for item in resp_json['cast']:
-                                # filter out non-acting roles
-                                if not include_non_acting_roles and \
-                                        ((item['character'].strip() == '') or
-                                         'narrat' in item['character'].lower() or
-                                         'himself' in item['character'].lower()):
-                                    continue
-                                if item not in processed:
-                                    if object_name.rstrip('s') not in item and 'title' in item:
-                                        processed.append({object_name.rstrip('s'): item})
-                                    else:
-                                        processed.append(item)
-                        else:
-                            for item in resp_json:
-                                if item not in processed:
-                                    if object_name.rstrip('s') not in item and 'title' in item:
-                                        processed.append({object_name.rstrip('s'): item})
-                                    else:
-                                        processed.append(item)
-
-                    elif resp_data == '[]':
-                        log.warning("Received empty JSON response for page: %d of %d", current_page, total_pages)
+        resp = self._request_page(url, payload, 1, authenticate_user, type_name, object_name,
+                                  include_non_acting_roles, fields)
+        if resp is None:
+            raise TraktError("Failed retrieving {} {} page 1".format(type_name, object_name))
+        req, items = resp
+
+        total_pages = 0 if 'X-Pagination-Page-Count' not in req.headers else int(
+            req.headers['X-Pagination-Page-Count'])
+        last_page = min(total_pages, pages) if pages else total_pages
+        log.debug("Response Page: %d of %d", 1, total_pages)
+
+        if last_page > 1:
+            log.info("There are %d page(s) left to retrieve results from.", last_page - 1)
+        elif total_pages == 0:
+            log.debug("There were no more pages left to retrieve.")
+
+        # fetch the next pages concurrently, the user's rate limiter keeps them within Trakt's limits
+        workers = self.cfg.trakt.page_workers or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            next_page = 2
+            current_page = 1
+            try:
+                while True:
+                    while next_page <= last_page and len(pending) < workers * 2:
+                        pending.append(executor.submit(self._request_page, url, payload, next_page,
+                                                       authenticate_user, type_name, object_name,
+                                                       include_non_acting_roles, fields))
+                        next_page += 1
+
+                    if current_page > 1:
+                        resp = pending.popleft().result()
+                        if resp is None:
+                            raise TraktError("Failed retrieving {} {} page {}".format(type_name, object_name,
+                                                                                       current_page))
+                        req, items = resp
+
+                    if req.status_code == 200 and items is not None:
+                        log.info("Retrieved %s %s page %d of %d", type_name, object_name, current_page, total_pages)
+                        for item in items:
+                            key = self._item_key(item)
+                            if key not in seen:
+                                seen.add(key)
+                                yield item
+                    elif req.status_code == 401:
+                        log.error("The authentication to Trakt is revoked. Please re-authenticate.")
+                        exit()
                     else:
-                        log.warning("Received malformed JSON response for page: %d of %d", current_page, total_pages)
+                        raise TraktError("Failed to retrieve {} {} page {}, request response: {}".format(
+                            type_name, object_name, current_page, req.status_code))
 
-                    # check if we have fetched the last page, break if so
-                    if total_pages == 0:
-                        log.debug("There were no more pages left to retrieve.")
+                    if current_page >= last_page:
                         break
-                    elif pages and current_page >= pages:
-                        log.debug("Do not need to download additional pages")
-                        break
-                    elif current_page >= total_pages:
-                        log.debug("There are no more pages left to retrieve results from.")
-                        break
-                    else:
-                        log.info("There are %d page(s) left to retrieve results from.", total_pages - current_page)
-                        payload['page'] += 1
-                        time.sleep(sleep_between)
+                    current_page += 1
+            finally:
+                for future in pending:
+                    future.cancel()
 
-                elif req.status_code == 401:
-                    log.error("The authentication to Trakt is revoked. Please re-authenticate.")
-                    exit()
-                else:
-                    log.error("Failed to retrieve %s %s, request response: %d",
-                              type_name, object_name, req.status_code)
-                    break
+        log.debug("Found %d %s %s", len(seen), type_name, object_name)
+
+    def _make_items_request(self, url, limit, type_name, object_name, **kwargs):
+        return self._collect(self._iter_items(url, limit, type_name, object_name, **kwargs),
+                             "{} {}".format(type_name, object_name))
 
+    @staticmethod
+    def _collect(items, description):
+        """Drain an items iterator into a list, None when nothing was found or a page failed"""
+        try:
+            processed = list(items)
             if len(processed):
-                log.debug("Found %d %s %s", len(processed), type_name, object_name)
                 return processed
-
             return None
+        except CircuitOpenError:
+            raise
+        except TraktError as e:
+            log.error("%s, aborting...", e)
         except Exception:
-            log.exception("Exception retrieving %s %s: ", type_name, object_name)
+            log.exception("Exception retrieving %s: ", description)
         return None
 
+    @staticmethod
+    def _item_key(item):
+        """
+        De-duplication key of a paged item: the Trakt id of the object it wraps
+        plus the item's own scalar fields (rank, watchers, listed_at...), or a
+        stable hash of the whole item when it carries no Trakt id.
+        """
+        for name, value in item.items():
+            if isinstance(value, dict) and isinstance(value.get('ids'), dict) and 'trakt' in value['ids']:
+                extra = tuple(sorted((k, v) for k, v in item.items()
+                                     if k != name and not isinstance(v, (dict, list))))
+                return name, value['ids']['trakt'], extra
+        return hashlib.sha1(codec.dumps(item, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _request_page(self, url, payload, page, authenticate_user, type_name, object_name,
+                      include_non_acting_roles=False, fields=None):
+        """Fetch one page and decode its items, run inside the page worker pool"""
+        try:
+            req, resp_json = self._make_request(url, dict(payload, page=page), authenticate_user)
+            items = None
+            if req.status_code == 200:
+                items = self._page_items(resp_json, type_name, object_name, include_non_acting_roles, page)
+                if payload.get('extended') == 'full':
+                    self._catalog_items(items)
+                if fields:
+                    items = [project(item, fields) for item in items]
+            return req, items
+        except CircuitOpenError:
+            raise
+        except Exception:
+            log.exception("Exception retrieving %s %s page %d: ", type_name, object_name, page)
+        return None
+
+    def _catalog_items(self, items):
+        for kind in ('movie', 'show'):
+            self.catalog.add(kind, [item[kind] for item in items if isinstance(item.get(kind), dict)])
+
+    def _page_items(self, resp_json, type_name, object_name, include_non_acting_roles, page):
+        items = []
+        if isinstance(resp_json, dict) and type_name == 'person' and 'cast' in resp_json:
+            for item in resp_json['cast']:
+                # filter out non-acting roles
+                if not include_non_acting_roles and \
+                        ((item['character'].strip() == '') or
+                         'narrat' in item['character'].lower() or
+                         'himself' in item['character'].lower()):
+                    continue
+                if object_name.rstrip('s') not in item and 'title' in item:
+                    items.append({object_name.rstrip('s'): item})
+                else:
+                    items.append(item)
+        elif isinstance(resp_json, list) and resp_json:
+            for item in resp_json:
+                if object_name.rstrip('s') not in item and 'title' in item:
+                    items.append({object_name.rstrip('s'): item})
+                else:
+                    items.append(item)
+        elif resp_json == []:
+            log.warning("Received empty JSON response for page: %d", page)
+        else:
+            log.warning("Received malformed JSON response for page: %d", page)
+        return items
+
     def validate_client_id(self):
         try:
             # request anticipated shows to validate client_id
@@ -263,6 +372,8 @@ class Trakt:
             if req.status_code == 200:
                 return True
             return False
+        except CircuitOpenError:
+            raise
         except Exception:
             log.exception("Exception validating client_id: ")
         return False
@@ -288,10 +399,10 @@ class Trakt:
         log.debug(self._headers_without_authentication())
 
         # Request device code
-        req = requests.post(self.cfg.trakt.baseurl + '/oauth/device/code',
-                            params=payload,
-                            headers=self._headers_without_authentication())
-        device_code_response = req.json()
+        req = transport.post(self.cfg.trakt.baseurl + '/oauth/device/code',
+                             params=payload,
+                             headers=self._headers_without_authentication())
+        device_code_response = codec.loads(req.content)
         log.debug(device_code_response)
 
         # Display needed information to the user
@@ -305,20 +416,20 @@ class Trakt:
 
         if req.status_code == 200:
             # Success; saving the access token
-            access_token_response = req.json()
+            access_token_response = codec.loads(req.content)
             access_token = access_token_response['access_token']
 
             # But first we need to find out what user this token belongs to
             temp_headers = self._headers_without_authentication()
             temp_headers['Authorization'] = 'Bearer ' + access_token
 
-            req = requests.get(self.cfg.trakt.baseurl + '/users/me',
-                               headers=temp_headers)
+            req = transport.get(self.cfg.trakt.baseurl + '/users/me',
+                                headers=temp_headers)
 
             new_config = Config()
             new_config.merge_settings({
                 "trakt": {
-                    req.json()['username']: access_token_response
+                    codec.loads(req.content)['username']: access_token_response
                 }
             })
 
@@ -358,9 +469,10 @@ class Trakt:
                        'grant_type': 'authorization_code'}
 
             # Poll Trakt for access token
-            req = requests.post(self.cfg.trakt.baseurl + '/oauth/device/token',
-                                params=payload,
-                                headers=self._headers_without_authentication())
+            req = transport.post(self.cfg.trakt.baseurl + '/oauth/device/token',
+                                 params=payload,
+                                 headers=self._headers_without_authentication(),
+                                 retry=False)
 
             success, status_code = self.__oauth_process_token_request(req)
 
@@ -376,8 +488,8 @@ class Trakt:
         payload = {'refresh_token': refresh_token, 'client_id': self.cfg.trakt.client_id,
                    'client_secret': self.cfg.trakt.client_secret, 'grant_type': 'refresh_token'}
 
-        req = requests.post('https://api.trakt.tv/oauth/token', params=payload,
-                            headers=self._headers_without_authentication())
+        req = transport.post('https://api.trakt.tv/oauth/token', params=payload,
+                             headers=self._headers_without_authentication())
 
         success, status_code = self.__oauth_process_token_request(req)
 
@@ -390,6 +502,8 @@ class Trakt:
                                                   device_code_response['interval'],
                                                   device_code_response['expires_in']):
                 return True
+        except CircuitOpenError:
+            raise
         except Exception:
             log.exception("Exception occurred when authenticating user")
         return False
@@ -398,7 +512,7 @@ class Trakt:
         import copy
         users = copy.copy(self.cfg.trakt)
 
-        for k in ['client_id', 'client_secret', 'baseurl']:
+        for k in self.config_keys:
             if k in users.keys():
                 users.pop(k)
 
@@ -408,21 +522,26 @@ class Trakt:
     def _user_is_authenticated(self, user):
         return user in self.cfg['trakt'].keys()
 
-    def _renew_oauth_token_if_expired(self, user):
+    def _renew_oauth_token_if_expired(self, user, margin=0):
         token_information = self.cfg['trakt'][user]
 
-        # Check if the access_token for the user is expired
+        # Check if the access_token for the user is expired, or will be within margin seconds
         expires_at = token_information['created_at'] + token_information['expires_in']
-        if expires_at < round(time.time()):
-            log.info("The access token for the user %s has expired. We're requesting a new one; please wait a moment.",
-                     user)
+        if expires_at - margin < round(time.time()):
+            log.info("The access token for the user %s expires %s. We're requesting a new one; please wait a moment.",
+                     user, time.strftime('%c', time.localtime(expires_at)))
 
             if self.__oauth_refresh_access_token(token_information["refresh_token"]):
-                log.info("The access token for the user %s has been refreshed. Please restart the application.", user)
+                self.cfg['trakt'][user] = Config().cfg['trakt'][user]
+                log.info("The access token for the user %s has been refreshed.", user)
+                return True
+        return False
 
     def _user_used_for_authentication(self, user=None):
         if user is None:
-            user = self._get_first_authenticated_user()
+            if self.cfg.trakt.client_id not in self._first_users:
+                self._first_users[self.cfg.trakt.client_id] = self._get_first_authenticated_user()
+            user = self._first_users[self.cfg.trakt.client_id]
         elif not self._user_is_authenticated(user):
             log.error('The user %s you specified to use for authentication is not authenticated yet. ' +
                       'Authenticate the user first, before you use it to retrieve lists.', user)
@@ -439,13 +558,41 @@ class Trakt:
             'trakt-api-key': self.cfg.trakt.client_id,
         }
 
+    def _auth_headers_for(self, user):
+        """
+        Headers authenticating user, built once and kept until the token is
+        due for a refresh. The refresh happens under a lock so concurrent
+        requests wait for one refresh instead of each starting their own.
+        """
+        key = (self.cfg.trakt.client_id, user)
+        cached = self._auth_headers.get(key)
+        if cached is not None and cached['refresh_at'] > time.time():
+            return cached['headers']
+
+        with self._auth_lock:
+            cached = self._auth_headers.get(key)
+            if cached is not None and cached['refresh_at'] > time.time():
+                return cached['headers']
+
+            # never refresh earlier than halfway through a token's life, or short-lived tokens refresh on every run
+            margin = min(self.cfg.trakt.token_refresh_margin or 0, self.cfg['trakt'][user]['expires_in'] // 2)
+            self._renew_oauth_token_if_expired(user, margin)
+            token_information = self.cfg['trakt'][user]
+            expires_at = token_information['created_at'] + token_information['expires_in']
+
+            headers = self._headers_without_authentication()
+            headers['Authorization'] = 'Bearer ' + token_information['access_token']
+            # if the refresh failed try again in a few minutes instead of on every request
+            refresh_at = expires_at - margin if expires_at - margin > time.time() else time.time() + 300
+            self._auth_headers[key] = {'headers': headers, 'refresh_at': refresh_at}
+        return headers
+
     def _headers(self, user=None):
-        headers = self._headers_without_authentication()
         user = self._user_used_for_authentication(user)
         if user is not None:
-            self._renew_oauth_token_if_expired(user)
-            headers['Authorization'] = 'Bearer ' + self.cfg['trakt'][user]['access_token']
+            headers = dict(self._auth_headers_for(user))
         else:
+            headers = self._headers_without_authentication()
             log.info('No user')
 
         return headers, user
@@ -454,13 +601,21 @@ class Trakt:
     # Shows
     ############################################################
 
-    def get_show(self, show_id):
-        return self._make_item_request(
+    def get_show(self, show_id, extended='full'):
+        show = self.catalog.get('show', show_id)
+        if show is not None:
+            return show
+
+        show = self._make_item_request(
             url='https://api.trakt.tv/shows/%s' % str(show_id),
             object_name='show',
+            extended=extended,
         )
+        if show is not None and self.extended_levels[extended] == 'full':
+            self.catalog.add('show', [show])
+        return show
 
-    @cache(cache_file=cachefile, retry_if_blank=True)
+    @cache_by_arguments(cache_file=cachefile, retry_if_blank=True)
     def get_trending_shows(
             self,
             limit=1000,
@@ -469,6 +624,8 @@ class Trakt:
             languages=None,
             genres=None,
             runtimes=None,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -481,9 +638,11 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
-    @cache(cache_file=cachefile, retry_if_blank=True)
+    @cache_by_arguments(cache_file=cachefile, retry_if_blank=True)
     def get_popular_shows(
             self,
             limit=1000,
@@ -492,6 +651,8 @@ class Trakt:
             languages=None,
             genres=None,
             runtimes=None,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -504,9 +665,11 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
-    @cache(cache_file=cachefile, retry_if_blank=True)
+    @cache_by_arguments(cache_file=cachefile, retry_if_blank=True)
     def get_anticipated_shows(
             self,
             limit=1000,
@@ -515,6 +678,8 @@ class Trakt:
             languages=None,
             genres=None,
             runtimes=None,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -527,6 +692,8 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
     def get_person_shows(
@@ -539,6 +706,8 @@ class Trakt:
             genres=None,
             runtimes=None,
             include_non_acting_roles=False,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -552,9 +721,11 @@ class Trakt:
             genres=genres,
             runtimes=runtimes,
             include_non_acting_roles=include_non_acting_roles,
+            extended=extended,
+            fields=fields,
         )
 
-    @cache(cache_file=cachefile, retry_if_blank=True)
+    @cache_by_arguments(cache_file=cachefile, retry_if_blank=True)
     def get_most_played_shows(
             self,
             limit=1000,
@@ -564,6 +735,8 @@ class Trakt:
             genres=None,
             runtimes=None,
             most_type=None,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -576,9 +749,11 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
-    @cache(cache_file=cachefile, retry_if_blank=True)
+    @cache_by_arguments(cache_file=cachefile, retry_if_blank=True)
     def get_most_watched_shows(
             self,
             limit=1000,
@@ -588,6 +763,8 @@ class Trakt:
             genres=None,
             runtimes=None,
             most_type=None,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -600,9 +777,11 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
-    @cache(cache_file=cachefile, retry_if_blank=True)
+    @cache_by_arguments(cache_file=cachefile, retry_if_blank=True)
     def get_recommended_shows(
             self,
             authenticate_user=None,
@@ -612,6 +791,8 @@ class Trakt:
             languages=None,
             genres=None,
             runtimes=None,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -625,6 +806,8 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
     def get_watchlist_shows(
@@ -636,6 +819,8 @@ class Trakt:
             languages=None,
             genres=None,
             runtimes=None,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -649,6 +834,8 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
     def get_user_list_shows(
@@ -661,6 +848,8 @@ class Trakt:
             languages=None,
             genres=None,
             runtimes=None,
+            extended='full',
+            fields=None,
     ):
 
         list_user, list_key = extract_list_user_and_key_from_url(list_url)
@@ -678,20 +867,29 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
     ############################################################
     # Movies
     ############################################################
 
-    def get_movie(self, movie_id):
-        return self._make_item_request(
+    def get_movie(self, movie_id, extended='full'):
+        movie = self.catalog.get('movie', movie_id)
+        if movie is not None:
+            return movie
+
+        movie = self._make_item_request(
             url='https://api.trakt.tv/movies/%s' % str(movie_id),
             object_name='movie',
+            extended=extended,
         )
+        if movie is not None and self.extended_levels[extended] == 'full':
+            self.catalog.add('movie', [movie])
+        return movie
 
-    @cache(cache_file=cachefile, cache_time=1799, retry_if_blank=True)
-    def get_trending_movies(
+    def iter_trending_movies(
             self,
             limit=1000,
             pages=None,
@@ -699,8 +897,10 @@ class Trakt:
             countries=None,
             languages=None,
             genres=None,
-            runtimes=None):
-        return self._make_items_request(
+            runtimes=None,
+            extended='full',
+            fields=None):
+        return self._iter_items(
             url=self.cfg.trakt.baseurl + "/movies/trending",
             object_name='movies',
             type_name='trending',
@@ -710,23 +910,43 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
-            pages=pages)
+            pages=pages,
+            extended=extended,
+            fields=fields)
 
-    def get_top_trending_movies(self, number):
-        return self.get_trending_movies(number, 1)
+    @cache_by_arguments(cache_file=cachefile, cache_time=1799, retry_if_blank=True)
+    def get_trending_movies(
+            self,
+            limit=1000,
+            pages=None,
+            years=None,
+            countries=None,
+            languages=None,
+            genres=None,
+            runtimes=None,
+            extended='full',
+            fields=None):
+        return self._collect(
+            self.iter_trending_movies(limit, pages, years, countries, languages, genres, runtimes, extended, fields),
+            'trending movies')
 
-    @cache(cache_file=cachefile, retry_if_blank=True)
-    def get_popular_movies(
+    def get_top_trending_movies(self, number, extended='full', fields=None):
+        return self.get_trending_movies(number, 1, extended=extended, fields=fields)
+
+    def iter_popular_movies(
             self,
             limit=1000,
+            pages=None,
             years=None,
             countries=None,
             languages=None,
             genres=None,
             runtimes=None,
+            extended='full',
+            fields=None,
     ):
 
-        return self._make_items_request(
+        return self._iter_items(
             url='https://api.trakt.tv/movies/popular',
             object_name='movies',
             type_name='popular',
@@ -736,9 +956,29 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            pages=pages,
+            extended=extended,
+            fields=fields,
         )
 
-    @cache(cache_file=cachefile, retry_if_blank=True)
+    @cache_by_arguments(cache_file=cachefile, retry_if_blank=True)
+    def get_popular_movies(
+            self,
+            limit=1000,
+            years=None,
+            countries=None,
+            languages=None,
+            genres=None,
+            runtimes=None,
+            extended='full',
+            fields=None,
+    ):
+
+        return self._collect(
+            self.iter_popular_movies(limit, None, years, countries, languages, genres, runtimes, extended, fields),
+            'popular movies')
+
+    @cache_by_arguments(cache_file=cachefile, retry_if_blank=True)
     def get_anticipated_movies(
             self,
             limit=1000,
@@ -747,6 +987,8 @@ class Trakt:
             languages=None,
             genres=None,
             runtimes=None,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -759,6 +1001,8 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
     def get_person_movies(
@@ -771,6 +1015,8 @@ class Trakt:
             genres=None,
             runtimes=None,
             include_non_acting_roles=False,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -784,9 +1030,11 @@ class Trakt:
             genres=genres,
             runtimes=runtimes,
             include_non_acting_roles=include_non_acting_roles,
+            extended=extended,
+            fields=fields,
         )
 
-    @cache(cache_file=cachefile, retry_if_blank=True)
+    @cache_by_arguments(cache_file=cachefile, retry_if_blank=True)
     def get_most_played_movies(
             self,
             limit=1000,
@@ -796,6 +1044,8 @@ class Trakt:
             genres=None,
             runtimes=None,
             most_type=None,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -808,10 +1058,11 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
-    @cache(cache_file=cachefile, retry_if_blank=True)
-    def get_most_watched_movies(
+    def iter_most_watched_movies(
             self,
             limit=1000,
             pages=None,
@@ -820,8 +1071,10 @@ class Trakt:
             languages=None,
             genres=None,
             most_type=None,
-            runtimes=None):
-        return self._make_items_request(
+            runtimes=None,
+            extended='full',
+            fields=None):
+        return self._iter_items(
             url=self.cfg.trakt.baseurl + "/movies/watched/{}".format('weekly' if not most_type else most_type),
             object_name='movies',
             type_name='watched',
@@ -831,14 +1084,36 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
-            pages=pages)
+            pages=pages,
+            extended=extended,
+            fields=fields)
 
-    def get_top_most_watched_movies(self, number):
-        return self.get_most_watched_movies(number, 1)
+    @cache_by_arguments(cache_file=cachefile, retry_if_blank=True)
+    def get_most_watched_movies(
+            self,
+            limit=1000,
+            pages=None,
+            years=None,
+            countries=None,
+            languages=None,
+            genres=None,
+            most_type=None,
+            runtimes=None,
+            extended='full',
+            fields=None):
+        return self._collect(
+            self.iter_most_watched_movies(limit, pages, years, countries, languages, genres, most_type, runtimes,
+                                          extended, fields),
+            'watched movies')
+
+    def get_top_most_watched_movies(self, number, extended='full', fields=None):
+        return self.get_most_watched_movies(number, 1, extended=extended, fields=fields)
 
     def get_boxoffice_movies(
             self,
             limit=1000,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -846,6 +1121,8 @@ class Trakt:
             object_name='movies',
             type_name='anticipated',
             limit=limit,
+            extended=extended,
+            fields=fields,
         )
 
     def get_recommended_movies(
@@ -857,6 +1134,8 @@ class Trakt:
             languages=None,
             genres=None,
             runtimes=None,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -870,6 +1149,8 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
     def get_watchlist_movies(
@@ -881,6 +1162,8 @@ class Trakt:
             languages=None,
             genres=None,
             runtimes=None,
+            extended='full',
+            fields=None,
     ):
 
         return self._make_items_request(
@@ -894,33 +1177,137 @@ class Trakt:
             languages=languages,
             genres=genres,
             runtimes=runtimes,
+            extended=extended,
+            fields=fields,
         )
 
-    def get_user_list_movies(self, list_user, list_key):
+    def iter_user_list_movies(self, list_user, list_key, extended='full', fields=None):
         log.debug('Fetching %s\'s %s Trakt list', list_user, list_key)
-        return self._make_items_request(
+        return self._iter_items(
             url=self.cfg.trakt.baseurl + "/users/{u}/lists/{k}/items/movies".format(u=list_user, k=list_key),
             object_name='movies',
             type_name=("{k} from {u}".format(u=list_user, k=list_key)),
-            limit=1000)
+            limit=1000,
+            extended=extended,
+            fields=fields)
+
+    def get_user_list_movies(self, list_user, list_key, extended='full', fields=None):
+        return self._collect(self.iter_user_list_movies(list_user, list_key, extended, fields),
+                             "{k} from {u} movies".format(u=list_user, k=list_key))
 
-    @cache(cache_file=cachefile, cache_time=1799, retry_if_blank=True)
+    def get_user_list_movies_imdb_set(self, list_user, list_key):
+        """imdb ids on a list, an empty set for an empty list and None when it can not be retrieved"""
+        try:
+            return {i['movie']['ids']['imdb'] for i in self.iter_user_list_movies(list_user, list_key, extended='ids',
+                                                                                   fields=['movie.ids.imdb'])}
+        except CircuitOpenError:
+            raise
+        except TraktError as e:
+            log.error("%s, aborting...", e)
+        except Exception:
+            log.exception("Exception retrieving %s from %s movies: ", list_key, list_user)
+        return None
+
+    @cache_by_arguments(cache_file=cachefile, cache_time=1799, retry_if_blank=True)
     def get_user_list_movies_imdb(self, list_user, list_key):
-        return [i['movie']['ids']['imdb'] for i in self.get_user_list_movies(list_user, list_key)]
+        items = self.iter_user_list_movies(list_user, list_key, extended='ids', fields=['movie.ids.imdb'])
+        return self._collect((i['movie']['ids']['imdb'] for i in items),
+                             "{k} from {u} movies".format(u=list_user, k=list_key))
+
+    def _write_user_list_movies(self, list_user, list_key, endpoint, data):
+        """
+        Post data['movies'] to a list endpoint in chunks of write_chunk_size,
+        a few chunks at a time. Chunks are sent once each and the ones that
+        fail are retried here, on their own, up to write_retries more times
+        with the transport's backoff and retry budget, unless Trakt refused
+        them with a final 4xx. Returns the responses of the chunks that went
+        through merged into one, and how many chunks failed for good.
+        """
+        url = self.cfg.trakt.baseurl + "/users/{u}/lists/{k}/{e}".format(u=list_user, k=list_key, e=endpoint)
+        object_name = "{k} from {u}".format(u=list_user, k=list_key)
+        movies = data['movies']
+        size = self.cfg.trakt.write_chunk_size or len(movies) or 1
+        pending = [movies[i:i + size] for i in range(0, len(movies), size)]
+        total_chunks = len(pending)
+
+        def write(chunk):
+            """(decoded response, response) of writing chunk, the decoded response is None when it failed"""
+            try:
+                # the loop below owns the retries, the transport sends every chunk once
+                req, resp_json = self._make_request(url, data={'movies': chunk}, request_type='post', retry=False)
+            except CircuitOpenError:
+                raise
+            except Exception:
+                log.exception("Exception writing %d movie(s) to %s: ", len(chunk), object_name)
+                return None, None
+            if req.status_code in (200, 201) and resp_json is not None:
+                return resp_json, req
+            log.error("Failed to write %d movie(s) to %s, request response: %d", len(chunk), object_name,
+                      req.status_code)
+            return None, req
+
+        merged = {}
+        rejected = 0
+        failures = []
+        for attempt in range(1 + (self.cfg.trakt.write_retries or 0)):
+            if not pending:
+                break
+            if attempt:
+                wait = max(transport.retry.wait_for(attempt, req) for req in failures)
+                if wait > transport.retry.max_wait or not transport.retry.budget.spend(wait):
+                    log.warning("Not retrying %d failed chunk(s) for %s %s Trakt list", len(pending), list_user,
+                                list_key)
+                    break
+                log.info("Retrying %d failed chunk(s) for %s %s Trakt list in %0.1f seconds", len(pending), list_user,
+                         list_key, wait)
+                time.sleep(wait)
+            with ThreadPoolExecutor(max_workers=self.cfg.trakt.write_workers or 1) as executor:
+                responses = list(executor.map(write, pending))
+
+            failed = []
+            failures = []
+            for chunk, (resp, req) in zip(pending, responses):
+                if resp is not None:
+                    self._merge_write_response(merged, resp)
+                elif req is not None and 400 <= req.status_code < 500 and \
+                        req.status_code not in RetryPolicy.retry_statuses:
+                    # sending the same chunk again would be refused the same way
+                    rejected += 1
+                else:
+                    failed.append(chunk)
+                    failures.append(req)
+            pending = failed
+
+        failed = len(pending) + rejected
+        if failed:
+            log.error("%d of %d chunk(s) could not be written to %s %s Trakt list",
+                      failed, total_chunks, list_user, list_key)
+        return merged, failed
+
+    @staticmethod
+    def _merge_write_response(merged, resp):
+        """Add the counts and not_found items of one write response to merged"""
+        for key, value in resp.items():
+            if key == 'list' or not isinstance(value, (dict, list, int)):
+                # list summary (updated_at, item_count) of the latest chunk
+                merged[key] = value
+            elif isinstance(value, dict):
+                Trakt._merge_write_response(merged.setdefault(key, {}), value)
+            elif isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            else:
+                merged[key] = merged.get(key, 0) + value
 
     def post_user_list_movies(self, list_user, list_key, data):
         log.debug('Placing %s onto %s %s Trakt List ', data, list_user, list_key)
-        resp = self._make_item_request(
-            url=self.cfg.trakt.baseurl + "/users/{u}/lists/{k}/items".format(u=list_user, k=list_key),
-            object_name=("{k} from {u}".format(u=list_user, k=list_key)),
-            request_type='post',
-            data=data)
-        if resp['added']['movies']:
+        resp, failed = self._write_user_list_movies(list_user, list_key, 'items', data)
+        if resp.get('added', {}).get('movies'):
             log.info('Added %s movie(s) to %s %s Trakt list', resp['added']['movies'], list_user, list_key)
-        if resp['existing']['movies']:
+        if resp.get('existing', {}).get('movies'):
             log.info("Found %s movie(s) already in %s %s Trakt list", resp['existing']['movies'], list_user, list_key)
-        if resp['not_found']['movies']:
+        if resp.get('not_found', {}).get('movies'):
             log.error("Couldn't find %s to add to %s %s Trakt list", resp['not_found']['movies'], list_user, list_key)
+        return not failed
 
     def post_user_list_movies_imdb(self, list_user, list_key, ids):
         data = {"movies": []}
@@ -930,19 +1317,184 @@ class Trakt:
 
     def delete_user_list_movies(self, list_user, list_key, data):
         log.debug('Removing %s from %s %s Trakt List ', data, list_user, list_key)
-        resp = self._make_item_request(
-            url=self.cfg.trakt.baseurl + "/users/{u}/lists/{k}/items/remove".format(u=list_user, k=list_key),
-            object_name=("{k} from {u}".format(u=list_user, k=list_key)),
-            request_type='post',
-            data=data)
-        if resp['deleted']['movies']:
+        resp, failed = self._write_user_list_movies(list_user, list_key, 'items/remove', data)
+        if resp.get('deleted', {}).get('movies'):
             log.info('Removed %s movie(s) from %s %s Trakt list', resp['deleted']['movies'], list_user, list_key)
-        if resp['not_found']['movies']:
+        if resp.get('not_found', {}).get('movies'):
             log.error("Couldn't find %s to delete from %s %s Trakt list",
                       resp['not_found']['movies'], list_user, list_key)
+        return not failed
 
     def delete_user_list_movies_imdb(self, list_user, list_key, ids):
         data = {"movies": []}
         for id in ids:
             data['movies'].append({"ids": {"imdb": id}})
         return self.delete_user_list_movies(list_user, list_key, data)
+
+    def get_partitioned_movies(self, partitions, source='trending', limit=1000, pages=None):
+        """
+        Crawl one unfiltered trending, popular or watched feed with
+        extended=full and split it locally into named result sets, i.e.
+        {'Action': {'genres': ['action']}, '90s': {'years': '1990-1999'}}.
+        Returns {name: items} keeping the feed's order, None when the crawl
+        fails. A movie can land in several sets.
+        """
+        # the crawl covers every language asked for, sets that ask for none keep Trakt's english default
+        partitions = {name: filters if filters.get('languages') else dict(filters, languages=['en'])
+                      for name, filters in partitions.items()}
+        languages = sorted({l.lower() for filters in partitions.values() for l in filters['languages']})
+
+        if source == 'trending':
+            items = self.iter_trending_movies(limit, pages, languages=languages)
+        elif source == 'popular':
+            items = self.iter_popular_movies(limit, pages, languages=languages)
+        elif source == 'watched':
+            items = self.iter_most_watched_movies(limit, pages, languages=languages)
+        else:
+            log.error("Can not partition the Trakt %s movies, use trending, popular or watched", source)
+            return None
+
+        items = self._collect(items, "{} movies".format(source))
+        if items is None:
+            return None
+
+        partitioned = {name: [item for item in items if matches_filters(item, filters)]
+                       for name, filters in partitions.items()}
+        log.debug("Split %d %s movies into %d set(s)", len(items), source, len(partitioned))
+        return partitioned
+
+    ############################################################
+    # Users
+    ############################################################
+
+    def authenticated_users(self):
+        return [user for user in self.cfg['trakt'].keys() if user not in self.config_keys]
+
+    def get_user_lists(self, list_user, authenticate_user=None):
+        return self._make_item_request(
+            url=self.cfg.trakt.baseurl + "/users/{u}/lists".format(u=list_user),
+            object_name="lists from {u}".format(u=list_user),
+            authenticate_user=authenticate_user,
+            extended='min',
+        )
+
+    def _get_user_sources(self, user, watchlist, recommended, lists, extended, fields):
+        """(source, items) for everything asked of one user, fetched in turn with their own token and budget"""
+        sources = []
+        if watchlist:
+            sources.append(('watchlist', self.get_watchlist_movies(authenticate_user=user, extended=extended,
+                                                                   fields=fields)))
+        if recommended:
+            sources.append(('recommended', self.get_recommended_movies(authenticate_user=user, extended=extended,
+                                                                       fields=fields)))
+        if lists:
+            for user_list in self.get_user_lists(user, authenticate_user=user) or []:
+                list_key = user_list['ids']['slug']
+                items = self._make_items_request(
+                    url=self.cfg.trakt.baseurl + "/users/{u}/lists/{k}/items/movies".format(u=user, k=list_key),
+                    object_name='movies',
+                    type_name="{k} from {u}".format(u=user, k=list_key),
+                    authenticate_user=user,
+                    limit=1000,
+                    extended=extended,
+                    fields=fields)
+                sources.append(('list ' + list_key, items))
+        return sources
+
+    def get_users_movies(self, users=None, watchlist=True, recommended=True, lists=False, extended='full',
+                         fields=None):
+        """
+        Watchlists, recommendations and, with lists, the personal lists of
+        every authenticated user (or of users), one user per thread.
+
+        Returns the movies merged by Trakt id, each with a 'sources' list of
+        {'user': ..., 'source': ...} saying whose watchlist, recommendations
+        or list it came from, in first seen order.
+        """
+        users = self.authenticated_users() if users is None else users
+        if not users:
+            log.error("There are no authenticated Trakt users to fetch movies for.")
+            return None
+
+        with ThreadPoolExecutor(max_workers=len(users)) as executor:
+            results = list(executor.map(
+                lambda user: self._get_user_sources(user, watchlist, recommended, lists, extended, fields), users))
+
+        merged = {}
+        for user, sources in zip(users, results):
+            for source, items in sources:
+                for item in items or []:
+                    key = item['movie']['ids'].get('trakt') if 'ids' in item.get('movie', {}) else None
+                    key = key if key is not None else self._item_key(item)
+                    if key not in merged:
+                        merged[key] = dict(item, sources=[])
+                    merged[key]['sources'].append({'user': user, 'source': source})
+        log.debug("Found %d movies across %d user(s)", len(merged), len(users))
+        return list(merged.values())
+
+    ############################################################
+    # Change Tracking
+    ############################################################
+
+    def get_user_list(self, list_user, list_key):
+        return self._make_item_request(
+            url=self.cfg.trakt.baseurl + "/users/{u}/lists/{k}".format(u=list_user, k=list_key),
+            object_name=("{k} from {u}".format(u=list_user, k=list_key)),
+            extended='min',
+        )
+
+    def get_last_activities(self, authenticate_user=None):
+        return self._make_item_request(
+            url=self.cfg.trakt.baseurl + "/sync/last_activities",
+            object_name='last activities',
+            authenticate_user=authenticate_user,
+            extended='min',
+        )
+
+    def user_list_updated_at(self, list_user, list_key):
+        """
+        When a list last changed, None when it can not be told. Lists of an
+        authenticated user are answered from one /sync/last_activities call
+        per run, which moves whenever any of their lists does; other lists
+        from their own summary.
+        """
+        if list_user not in self.config_keys and self._user_is_authenticated(list_user):
+            lists_updated_at = self._lists_updated_at.setdefault(self.cfg.trakt.client_id, {})
+            if list_user not in lists_updated_at:
+                activities = self.get_last_activities(list_user)
+                lists_updated_at[list_user] = activities['lists']['updated_at'] if activities else None
+            if lists_updated_at[list_user]:
+                return lists_updated_at[list_user]
+
+        summary = self.get_user_list(list_user, list_key)
+        return summary.get('updated_at') if summary else None
+
+    @staticmethod
+    def _list_state_key(consumer, list_user, list_key):
+        return "{c}:{u}/{k}".format(c=consumer, u=list_user, k=list_key)
+
+    def user_list_unchanged(self, consumer, list_user, list_key, updated_at, fingerprint=None):
+        """
+        True when consumer has already handled the list at updated_at, and the
+        fingerprint of whatever else its result depends on has not moved.
+        """
+        if updated_at is None:
+            return False
+        seen = self.user_list_seen(consumer, list_user, list_key) or {}
+        return seen.get('updated_at') == updated_at and seen.get('fingerprint') == fingerprint
+
+    def user_list_seen(self, consumer, list_user, list_key):
+        """State recorded by remember_user_list, None when consumer never handled the list"""
+        return self.list_state.get(self._list_state_key(consumer, list_user, list_key))
+
+    def remember_user_list(self, consumer, list_user, list_key, updated_at, fingerprint=None, entries=None):
+        """
+        Record that consumer has handled the list as of updated_at, along with
+        the entries it saw when it needs them again while the list is unchanged.
+        """
+        if updated_at is None:
+            return
+        state = {'updated_at': updated_at, 'fingerprint': fingerprint}
+        if entries is not None:
+            state['entries'] = entries
+        self.list_state.set(self._list_state_key(consumer, list_user, list_key), state)
@@ -0,0 +1,93 @@
+import requests
+import threading
+import time
+
+from .log import logger
+from .store import Store
+
+log = logger.get_logger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open"""
+
+    def __init__(self, service, failures):
+        super().__init__("{} is unavailable after {} consecutive failures".format(service, failures))
+        self.service = service
+        self.failures = failures
+
+
+class CircuitBreaker:
+    """
+    Per-service circuit breaker.
+
+    Opens after threshold consecutive failures and short-circuits every later
+    call in the run with CircuitOpenError. The open state is persisted, so the
+    next run starts half-open: calls go through as probes, the first success
+    closes the circuit again and the first failure re-opens it.
+
+    Can also be used as a context manager around calls that do not go through
+    the transport (plexapi).
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    failure_exceptions = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+    def __init__(self, service, threshold=3, store=None):
+        self.service = service
+        self.threshold = threshold
+        self.store = store or Store('circuit_breakers')
+        self.failures = 0
+        self._lock = threading.Lock()
+
+        saved = self.store.get(service)
+        if saved and saved['state'] != self.CLOSED:
+            log.info("%s was unavailable during the last run (%s), probing it again", service,
+                     time.strftime('%c', time.localtime(saved['opened'])))
+            self.state = self.HALF_OPEN
+            self.failures = saved['failures']
+        else:
+            self.state = self.CLOSED
+
+    def before(self):
+        if self.state == self.OPEN:
+            raise CircuitOpenError(self.service, self.failures)
+
+    def success(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                log.info("%s is available again, closing its circuit", self.service)
+                self.store.set(self.service, {'state': self.CLOSED, 'opened': None, 'failures': 0})
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.OPEN:
+                return
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                log.error("%s failed %d times in a row, opening its circuit", self.service, self.failures)
+                self.state = self.OPEN
+                self.store.set(self.service, {'state': self.OPEN, 'opened': time.time(), 'failures': self.failures})
+
+    def record(self, resp):
+        if resp.status_code >= 500:
+            self.failure()
+        else:
+            self.success()
+        return resp
+
+    def __enter__(self):
+        self.before()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.success()
+        elif issubclass(exc_type, self.failure_exceptions):
+            self.failure()
+        return False
@@ -0,0 +1,66 @@
+import time
+
+from .log import logger
+from .store import Store
+
+log = logger.get_logger(__name__)
+
+
+class Catalog:
+    """
+    On-disk catalog of Trakt metadata, kept in the store.
+
+    Each object is stored once under its Trakt id, with its IMDb, TMDb, TVDb
+    and slug ids pointing at it, so any of them answers a lookup. Entries
+    older than ttl seconds are treated as missing.
+    """
+
+    id_types = ['imdb', 'tmdb', 'tvdb', 'slug']
+
+    def __init__(self, ttl, store=None):
+        self.ttl = ttl
+        self.store = store or Store('trakt_catalog')
+
+    @staticmethod
+    def _key(kind, id_type, value):
+        return "{}:{}:{}".format(kind, id_type, value)
+
+    def add(self, kind, objects):
+        """Catalog objects of kind (movie, show) that carry a Trakt id"""
+        entries = []
+        for obj in objects:
+            ids = obj.get('ids') or {}
+            if ids.get('trakt') is None:
+                continue
+            entries.append((self._key(kind, 'trakt', ids['trakt']), obj))
+            for id_type in self.id_types:
+                if ids.get(id_type) is not None:
+                    entries.append((self._key(kind, id_type, ids[id_type]), ids['trakt']))
+        if entries:
+            self.store.set_many(entries)
+
+    def _fresh(self, key):
+        updated = self.store.updated(key)
+        return updated is not None and time.time() - updated < self.ttl
+
+    def get(self, kind, value, id_type=None):
+        """
+        Cataloged object of kind, None when unknown or stale. Without id_type
+        value is taken for a Trakt id when numeric, an IMDb id when it starts
+        with tt and a slug otherwise, as Trakt does for its own lookups.
+        """
+        if id_type is None:
+            value = str(value)
+            id_type = 'trakt' if value.isdigit() else 'imdb' if value.startswith('tt') else 'slug'
+
+        if id_type != 'trakt':
+            key = self._key(kind, id_type, value)
+            if not self._fresh(key):
+                return None
+            value = self.store.get(key)
+
+        key = self._key(kind, 'trakt', value)
+        if not self._fresh(key):
+            return None
+        log.debug("Found %s %s in the catalog", kind, value)
+        return self.store.get(key)
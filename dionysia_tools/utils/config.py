@@ -1,9 +1,10 @@
 import attrdict
-import json
 import pathlib
 import os
 import sys
 
+from ..helpers import codec
+
 
 class Singleton(type):
     _instances = {}
@@ -37,6 +38,15 @@ class Config(object, metaclass=Singleton):
         'core': {
             'debug': False
         },
+        'transport': {
+            'pool_size': 10,
+            'timeout': 30,
+            'retries': 4,
+            'max_retry_wait': 60,
+            'retry_budget': 50,
+            'retry_budget_sleep': 300,
+            'breaker_threshold': 3
+        },
         'trakt-update': {
             'cfdvd': {
                 'user': 'ewascome',
@@ -73,6 +83,9 @@ class Config(object, metaclass=Singleton):
         'plex': {
             'url': '',
             'token': '',
+            'index_full_sync': 86400,
+            'scan_page_size': 2000,
+            'scan_workers': 4,
         },
         'radarr': {
             'api_key': '',
@@ -96,7 +109,24 @@ class Config(object, metaclass=Singleton):
         'trakt': {
             'client_id': '',
             'client_secret': '',
-            'baseurl': 'https://api.trakt.tv'
+            'baseurl': 'https://api.trakt.tv',
+            'rate_limit': {
+                'calls': 1000,
+                'period': 300,
+                'burst': 10
+            },
+            'write_rate_limit': {
+                'calls': 1,
+                'period': 1,
+                'burst': 1
+            },
+            'page_workers': 4,
+            'token_refresh_margin': 86400,
+            'write_chunk_size': 100,
+            'write_workers': 2,
+            'write_retries': 2,
+            'list_workers': 3,
+            'catalog_ttl': 86400
         }
     }
 
@@ -148,7 +178,7 @@ class Config(object, metaclass=Singleton):
         if not os.path.exists(self.config_path):
             print("Dumping default config to: {}".format(self.config_path))
             with open(self.config_path, 'w') as fp:
-                json.dump(self.base_config, fp, sort_keys=True, indent=2)
+                codec.dump(self.base_config, fp, sort_keys=True, indent=2)
             return True
         else:
             return False
@@ -156,14 +186,14 @@ class Config(object, metaclass=Singleton):
     def dump_config(self):
         if os.path.exists(self.config_path):
             with open(self.config_path, 'w') as fp:
-                json.dump(self.conf, fp, sort_keys=True, indent=2)
+                codec.dump(self.conf, fp, sort_keys=True, indent=2)
             return True
         else:
             return False
 
     def load_config(self):
         with open(self.config_path, 'r') as fp:
-            return AttrConfig(json.load(fp))
+            return AttrConfig(codec.load(fp))
 
     def __inner_upgrade(self, settings1, settings2, key=None, overwrite=False):
         sub_upgraded = False
@@ -0,0 +1,52 @@
+import threading
+import time
+
+from .log import logger
+
+log = logger.get_logger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Holds up to capacity tokens and refills calls/period tokens per second;
+    acquire() blocks until a token is available so concurrent workers share
+    one rate budget.
+    """
+
+    _buckets = {}
+    _buckets_lock = threading.Lock()
+
+    def __init__(self, calls, period, capacity=None):
+        self.rate = float(calls) / period
+        self.capacity = float(capacity or calls)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, name, calls, period, capacity=None):
+        """Return the bucket shared by everything using name, creating it on first use"""
+        with cls._buckets_lock:
+            bucket = cls._buckets.get(name)
+            if bucket is None:
+                bucket = cls._buckets[name] = cls(calls, period, capacity)
+        return bucket
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                self._refill()
+                # tolerate float rounding so a refill that lands a hair short does not spin on tiny waits
+                if self.tokens >= tokens - 1e-9:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            log.debug("Rate limited, waiting %0.2f seconds for a token", wait)
+            time.sleep(wait)
@@ -0,0 +1,119 @@
+import dateutil.parser
+import random
+import requests
+import threading
+import time
+
+from ..helpers import codec
+from .log import logger
+
+log = logger.get_logger(__name__)
+
+
+class RetryBudget:
+    """
+    Retries and sleep time shared by every request in a run.
+
+    Once either is spent, failing calls are returned to the caller straight
+    away instead of stacking more attempts.
+    """
+
+    def __init__(self, retries=50, sleep=300):
+        self.retries = retries
+        self.sleep = sleep
+        self._lock = threading.Lock()
+
+    def spend(self, wait):
+        with self._lock:
+            if self.retries <= 0 or self.sleep < wait:
+                return False
+            self.retries -= 1
+            self.sleep -= wait
+            return True
+
+
+class RetryPolicy:
+    """
+    Single retry engine for every HTTP call.
+
+    Connection errors, timeouts, 429 and 5xx responses are retried, waiting
+    for whatever Retry-After or X-Ratelimit-* asks for and falling back to
+    exponential backoff with jitter. Any other 4xx is final.
+    """
+
+    retry_statuses = (408, 425, 429, 500, 502, 503, 504)
+    retry_exceptions = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+    def __init__(self, max_tries=4, base=1, max_wait=60, budget=None):
+        self.max_tries = max_tries
+        self.base = base
+        self.max_wait = max_wait
+        self.budget = budget or RetryBudget()
+
+    @staticmethod
+    def _header_wait(headers):
+        retry_after = headers.get('Retry-After')
+        if retry_after:
+            if retry_after.strip().isdigit():
+                return float(retry_after)
+            try:
+                return dateutil.parser.parse(retry_after).timestamp() - time.time()
+            except (ValueError, OverflowError):
+                pass
+
+        # Trakt sends a JSON document, other APIs a reset timestamp or delta
+        ratelimit = headers.get('X-Ratelimit')
+        if ratelimit:
+            try:
+                until = codec.loads(ratelimit).get('until')
+                if until:
+                    return dateutil.parser.parse(until).timestamp() - time.time()
+            except (ValueError, AttributeError, OverflowError):
+                pass
+
+        if headers.get('X-Ratelimit-Remaining', '').strip() == '0':
+            reset = headers.get('X-Ratelimit-Reset', '').strip()
+            if reset.isdigit():
+                reset = float(reset)
+                return reset - time.time() if reset > 1e9 else reset
+        return None
+
+    def wait_for(self, attempt, resp=None):
+        wait = self._header_wait(resp.headers) if resp is not None else None
+        if wait is None:
+            wait = self.base * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        return max(wait, 0)
+
+    def call(self, send, description=''):
+        attempt = 0
+        while True:
+            attempt += 1
+            resp = error = None
+            try:
+                resp = send()
+            except self.retry_exceptions as e:
+                error = e
+
+            if resp is not None and resp.status_code not in self.retry_statuses:
+                return resp
+            if attempt >= self.max_tries:
+                break
+
+            wait = self.wait_for(attempt, resp)
+            if wait > self.max_wait:
+                log.warning("%s asked to wait %d seconds, not retrying", description, wait)
+                break
+            if not self.budget.spend(wait):
+                log.warning("Retry budget for this run is spent, not retrying %s", description)
+                break
+
+            log.warning("Backing off %0.1f seconds after %d tries calling %s (%s)", wait, attempt, description,
+                        error if error is not None else resp.status_code)
+            if resp is not None:
+                resp.close()
+            time.sleep(wait)
+
+        if error is not None:
+            raise error
+        return resp
+
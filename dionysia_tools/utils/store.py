@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import threading
+import time
+
+from ..helpers import codec
+from .config import Config
+
+
+class Store:
+    """
+    Small persistent key/value table kept next to the cache file.
+
+    Values are JSON documents so anything the interfaces decode from an API can
+    be stored as is. Several tables share one sqlite file.
+    """
+
+    _connections = {}
+    _lock = threading.RLock()
+
+    def __init__(self, table, path=None):
+        self.table = table
+        self.path = path or os.path.join(os.path.dirname(Config().cachefile), 'store.db')
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, value TEXT, updated REAL)".format(self.table))
+            self._conn.commit()
+
+    @property
+    def _conn(self):
+        with self._lock:
+            conn = Store._connections.get(self.path)
+            if conn is None:
+                conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+                Store._connections[self.path] = conn
+        return conn
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM {} WHERE key = ?".format(self.table), (key,)).fetchone()
+        return codec.loads(row[0]) if row else default
+
+    def updated(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT updated FROM {} WHERE key = ?".format(self.table), (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO {} (key, value, updated) VALUES (?, ?, ?)".format(self.table),
+                               (key, codec.dumps(value), time.time()))
+            self._conn.commit()
+
+    def touch(self, key):
+        """Mark key as updated now, keeping its value"""
+        with self._lock:
+            self._conn.execute("UPDATE {} SET updated = ? WHERE key = ?".format(self.table), (time.time(), key))
+            self._conn.commit()
+
+    def set_many(self, items):
+        """Store every (key, value) pair of items in one transaction"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO {} (key, value, updated) VALUES (?, ?, ?)".format(self.table),
+                [(key, codec.dumps(value), now) for key, value in items])
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM {} WHERE key = ?".format(self.table), (key,))
+            self._conn.commit()
+
+    def delete_many(self, keys):
+        with self._lock:
+            self._conn.executemany("DELETE FROM {} WHERE key = ?".format(self.table), [(key,) for key in keys])
+            self._conn.commit()
+
+    def prune(self, max_age):
+        """Drop every row last set more than max_age seconds ago"""
+        with self._lock:
+            self._conn.execute("DELETE FROM {} WHERE updated < ?".format(self.table), (time.time() - max_age,))
+            self._conn.commit()
+
+    def items(self, prefix=''):
+        """(key, value) of every key starting with prefix"""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM {} WHERE substr(key, 1, ?) = ?".format(self.table),
+                                      (len(prefix), prefix)).fetchall()
+        return [(r[0], codec.loads(r[1])) for r in rows]
+
+    def keys(self, prefix=''):
+        with self._lock:
+            rows = self._conn.execute("SELECT key FROM {} WHERE substr(key, 1, ?) = ?".format(self.table),
+                                      (len(prefix), prefix)).fetchall()
+        return [r[0] for r in rows]
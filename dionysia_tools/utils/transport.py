@@ -0,0 +1,263 @@
+import requests
+import threading
+
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlsplit
+from ..helpers import codec
+from ..helpers.jsonstream import load_json_stream
+from .config import Config
+from .breaker import CircuitBreaker
+from .log import logger
+from .retry import RetryBudget, RetryPolicy
+from .store import Store
+
+log = logger.get_logger(__name__)
+
+
+class HTTPCache:
+    """
+    Conditional-GET cache.
+
+    Keeps the body of every GET response that came with an ETag or
+    Last-Modified validator so the next request for the same URL can be sent
+    with If-None-Match/If-Modified-Since and answered from here on a 304.
+    Entries neither stored nor revalidated for max_age seconds are dropped
+    when the cache is opened.
+    """
+
+    def __init__(self, store=None, max_age=7 * 86400):
+        self.store = store or Store('http_cache')
+        self.store.prune(max_age)
+
+    @staticmethod
+    def key(url, params=None):
+        return requests.Request('GET', url, params=params).prepare().url
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def conditional_headers(self, entry, headers=None):
+        headers = dict(headers or {})
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    @staticmethod
+    def cacheable(resp):
+        return resp.status_code == 200 and bool(resp.headers.get('ETag') or resp.headers.get('Last-Modified'))
+
+    def update(self, key, resp, body):
+        if not self.cacheable(resp):
+            return
+        self.store.set(key, {
+            'etag': resp.headers.get('ETag'),
+            'last_modified': resp.headers.get('Last-Modified'),
+            'headers': dict(resp.headers),
+            'body': body.decode('utf-8', 'surrogateescape'),
+        })
+
+    def touch(self, key):
+        """Keep a revalidated entry from being pruned"""
+        self.store.touch(key)
+
+    @staticmethod
+    def response(resp, entry):
+        cached = requests.Response()
+        cached.status_code = 200
+        cached.headers = CaseInsensitiveDict(entry['headers'])
+        cached.url = resp.url
+        cached.request = resp.request
+        cached.encoding = resp.encoding
+        cached.from_cache = True
+        body = entry['body'].encode('utf-8', 'surrogateescape')
+        cached._content = body
+        return cached, body
+
+
+class Transport:
+    """
+    Pooled HTTP transport shared by every interface.
+
+    One requests.Session is kept per host (scheme + netloc) so keep-alive
+    connections and TLS sessions are reused across calls instead of paying a
+    new handshake for every module-level requests.get/post/delete.
+    """
+
+    def __init__(self, pool_size=10, timeout=30, headers=None, cache=None, retry=None, breaker_threshold=3):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.cache = cache
+        self.retry = retry or RetryPolicy()
+        self.breaker_threshold = breaker_threshold
+        self.headers = {
+            'User-Agent': 'Dionysia-Tools',
+            'Connection': 'keep-alive',
+        }
+        if headers:
+            self.headers.update(headers)
+
+        self._sessions = {}
+        self._host_headers = {}
+        self._host_timeouts = {}
+        self._host_services = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host(url):
+        parts = urlsplit(url)
+        return "{}://{}".format(parts.scheme, parts.netloc).lower()
+
+    def register(self, url, headers=None, timeout=None, service=None):
+        """Set default headers, timeout and circuit breaker service for every request sent to the host of url"""
+        host = self.host(url)
+        with self._lock:
+            if service:
+                self._host_services[host] = service
+            if headers:
+                self._host_headers.setdefault(host, {}).update(headers)
+                if host in self._sessions:
+                    self._sessions[host].headers.update(headers)
+            if timeout:
+                self._host_timeouts[host] = timeout
+
+    def breaker(self, service):
+        with self._lock:
+            breaker = self._breakers.get(service)
+            if breaker is None:
+                breaker = self._breakers[service] = CircuitBreaker(service, self.breaker_threshold)
+        return breaker
+
+    def open_circuits(self):
+        return [b for b in self._breakers.values() if b.state == CircuitBreaker.OPEN]
+
+    def session(self, url):
+        host = self.host(url)
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update(self.headers)
+                session.headers.update(self._host_headers.get(host, {}))
+                self._sessions[host] = session
+                log.debug("Opened pooled session for %s (pool size %d)", host, self.pool_size)
+        return session
+
+    def request(self, method, url, retry=True, **kwargs):
+        """
+        Send a request through the pooled session of its host, retried by the
+        transport's RetryPolicy and guarded by the circuit breaker of the
+        service registered for the host.
+        """
+        host = self.host(url)
+        kwargs.setdefault('timeout', self._host_timeouts.get(host, self.timeout))
+        session = self.session(url)
+        service = self._host_services.get(host)
+        breaker = self.breaker(service) if service else None
+
+        def send():
+            return session.request(method, url, **kwargs)
+
+        if breaker:
+            breaker.before()
+        try:
+            if not retry:
+                resp = send()
+            else:
+                resp = self.retry.call(send, description="{} {}".format(method.upper(), url))
+        except CircuitBreaker.failure_exceptions:
+            if breaker:
+                breaker.failure()
+            raise
+        return breaker.record(resp) if breaker else resp
+
+    def fetch(self, method, url, revalidate=False, incremental=None, headers=None, params=None, chunk_size=65536,
+              **kwargs):
+        """
+        Send a request and decode its JSON body, returning (response, decoded
+        body). The body is only decoded for 2xx responses, otherwise None is
+        returned in its place.
+
+        Incremental decoding parses arrays element by element while they
+        stream in; otherwise the body is read whole and handed to the fast
+        codec. By default bodies are only decoded incrementally when no fast
+        codec is installed, as it costs nothing extra then.
+
+        GETs flagged revalidate go through the conditional-GET cache: stored
+        validators are sent along and a 304 is answered with the stored body.
+        """
+        if incremental is None:
+            incremental = not codec.accelerated
+
+        def decode(chunks, encoding='utf-8'):
+            if incremental:
+                return load_json_stream(chunks, encoding)
+            body = b''.join(chunks)
+            return codec.loads(body) if body.strip() else None
+
+        key = entry = None
+        if revalidate and self.cache is not None and method.lower() == 'get':
+            key = self.cache.key(url, params)
+            entry = self.cache.get(key)
+            if entry:
+                headers = self.cache.conditional_headers(entry, headers)
+
+        with self.request(method, url, headers=headers, params=params, stream=True, **kwargs) as resp:
+            if resp.status_code == 304 and entry:
+                log.debug("Not modified, serving cached body for %s", resp.url)
+                self.cache.touch(key)
+                cached, body = self.cache.response(resp, entry)
+                return cached, decode([body])
+            if not 200 <= resp.status_code < 300:
+                return resp, None
+
+            # only keep the raw body around when there is a validator to store it under
+            kept = [] if key and self.cache.cacheable(resp) else None
+
+            def chunks():
+                for chunk in resp.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        if kept is not None:
+                            kept.append(chunk)
+                        yield chunk
+
+            data = decode(chunks(), resp.encoding or 'utf-8')
+
+        if kept is not None:
+            self.cache.update(key, resp, b''.join(kept))
+        return resp, data
+
+    def get(self, url, **kwargs):
+        return self.request('get', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('post', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('put', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('delete', url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+# Default transport
+transport = Transport(pool_size=Config().cfg['transport']['pool_size'],
+                      timeout=Config().cfg['transport']['timeout'],
+                      cache=HTTPCache(),
+                      retry=RetryPolicy(max_tries=Config().cfg['transport']['retries'],
+                                        max_wait=Config().cfg['transport']['max_retry_wait'],
+                                        budget=RetryBudget(retries=Config().cfg['transport']['retry_budget'],
+                                                           sleep=Config().cfg['transport']['retry_budget_sleep'])),
+                      breaker_threshold=Config().cfg['transport']['breaker_threshold'])
@@ -14,6 +14,10 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=requires,
+    extras_require={
+        # faster JSON decoding, picked up by dionysia_tools.helpers.codec when installed
+        'fast': ['orjson'],
+    },
     # package_data={
     #     # If any package contains *.txt or *.rst files, include them:
     #     '': ['*.txt', '*.rst'],
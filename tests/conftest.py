@@ -0,0 +1,14 @@
+import os
+import tempfile
+
+from dionysia_tools.helpers import codec
+from dionysia_tools.utils.config import Config
+
+
+def pytest_configure(config):
+    # the package reads Config() at import time, so it has to exist before any test module is collected
+    directory = tempfile.mkdtemp(prefix='dionysia-tools-tests-')
+    configfile = os.path.join(directory, 'config.json')
+    with open(configfile, 'w') as fp:
+        codec.dump(Config.base_config, fp, sort_keys=True, indent=2)
+    Config(configfile, os.path.join(directory, 'cache.db'), os.path.join(directory, 'activity.log'))
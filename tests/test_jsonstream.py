@@ -0,0 +1,45 @@
+import pytest
+
+from dionysia_tools.helpers.jsonstream import iter_json_array, load_json_stream
+
+
+def chunked(text, size):
+    data = text.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1000])
+def test_array_matches_whole_decode_at_any_chunk_size(size):
+    text = '[1, 2.5, -30, "a\\"b", "é漢", true, false, null, {"k": [1, {"x": "]"}]}, [], 12345]'
+    assert load_json_stream(chunked(text, size)) == [1, 2.5, -30, 'a"b', 'é漢', True, False, None,
+                                                     {'k': [1, {'x': ']'}]}, [], 12345]
+
+
+def test_number_split_across_chunks_is_not_truncated():
+    assert list(iter_json_array(['[1', '23', '4.', '5]'])) == [1234.5]
+
+
+def test_empty_body_and_empty_array():
+    assert load_json_stream([]) is None
+    assert load_json_stream([b'  ', b'\n']) is None
+    assert load_json_stream([b' [ ', b' ] ']) == []
+
+
+def test_objects_are_decoded_whole():
+    assert load_json_stream([b'{"a"', b': 1}']) == {'a': 1}
+
+
+@pytest.mark.parametrize('chunks', [
+    [b'[1,2] garbage'],
+    [b'[1,2]', b' x'],
+    [b'[]', b','],
+])
+def test_trailing_data_fails_like_whole_decode(chunks):
+    with pytest.raises(ValueError):
+        load_json_stream(chunks)
+
+
+@pytest.mark.parametrize('chunks', [[b'[1, 2'], [b'[1 2]'], [b'[1,,2]']])
+def test_malformed_array_fails(chunks):
+    with pytest.raises(ValueError):
+        load_json_stream(chunks)
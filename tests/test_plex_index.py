@@ -0,0 +1,97 @@
+import xml.etree.ElementTree as ElementTree
+
+from dionysia_tools.interfaces.plex_index import IndexStore, LibraryIndex, decode_video, normalize_title, watermark
+
+
+class MemoryStore:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def set_many(self, items):
+        self.data.update(items)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def keys(self, prefix=''):
+        return [key for key in self.data if key.startswith(prefix)]
+
+    def items(self, prefix=''):
+        return [(key, self.data[key]) for key in self.keys(prefix)]
+
+
+def record(rating_key, title, year, guids=(), collections=(), added_at=1, updated_at=2):
+    return {
+        'ratingKey': rating_key,
+        'title': title,
+        'year': year,
+        'guids': list(guids),
+        'resolution': '1080',
+        'collections': list(collections),
+        'addedAt': added_at,
+        'updatedAt': updated_at,
+    }
+
+
+def test_decode_video():
+    element = ElementTree.fromstring(
+        '<Video ratingKey="12" title="Amélie" year="2001" guid="plex://movie/1" addedAt="5" updatedAt="7">'
+        '<Media videoResolution="4k"/><Guid id="imdb://tt0211915"/><Collection tag="French"/></Video>')
+    assert decode_video(element) == {
+        'ratingKey': 12,
+        'title': 'Amélie',
+        'year': 2001,
+        'guids': ['imdb://tt0211915', 'plex://movie/1'],
+        'resolution': '4k',
+        'collections': ['French'],
+        'addedAt': 5,
+        'updatedAt': 7,
+    }
+
+
+def test_normalize_title():
+    assert normalize_title("  Amélie:  The  MOVIE! ") == 'amelie the movie'
+    assert normalize_title(None) == ''
+
+
+def test_match_by_guid_before_title():
+    index = LibraryIndex([record(1, 'Heat', 1995, ['imdb://tt0113277']), record(2, 'Heat', 1986)])
+    assert index.match('Heat', 1986, {'imdb': 'tt0113277'})['ratingKey'] == 1
+    assert index.match('heat', 1986, {'imdb': 'tt0000000'})['ratingKey'] == 2
+    assert index.match('Heat', 2000) is None
+
+
+def test_add_replaces_and_remove_forgets():
+    index = LibraryIndex([record(1, 'Heat', 1995, ['tmdb://949'])])
+    index.add(record(1, 'Heat (Director)', 1995, ['tmdb://949']))
+    assert len(index) == 1
+    assert index.match('Heat', 1995) is None
+    assert index.match(ids={'tmdb': 949})['title'] == 'Heat (Director)'
+
+    index.remove(1)
+    index.remove(1)
+    assert len(index) == 0
+    assert index.match(ids={'tmdb': 949}) is None
+
+
+def test_collection_and_watermark():
+    records = [record(1, 'A', 2000, collections=['X'], updated_at=50), record(2, 'B', 2001, added_at=70)]
+    index = LibraryIndex(records)
+    assert [r['ratingKey'] for r in index.collection('X')] == [1]
+    assert watermark(records) == 70
+    assert watermark([], 10) == 10
+
+
+def test_index_store_write_keeps_state():
+    store = IndexStore(MemoryStore())
+    store.update('s', [record(1, 'A', 2000), record(2, 'B', 2001)], {'watermark': 5})
+    store.write('s', [record(1, 'A', 2000, collections=['X'])], removed=[2])
+    assert store.records('s') == [record(1, 'A', 2000, collections=['X'])]
+    assert store.state('s') == {'watermark': 5}
@@ -0,0 +1,47 @@
+from dionysia_tools.utils import ratelimit
+from dionysia_tools.utils.ratelimit import TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_burst_then_waits_for_refill(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, 'time', clock)
+
+    bucket = TokenBucket(calls=2, period=1, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+    bucket.acquire()
+    assert sum(clock.sleeps) == 0.5
+
+
+def test_refill_is_capped_at_capacity(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, 'time', clock)
+
+    bucket = TokenBucket(calls=10, period=1, capacity=2)
+    bucket.acquire(2)
+    clock.now += 60
+    bucket.acquire(2)
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert clock.sleeps
+
+
+def test_get_shares_one_bucket_per_name():
+    first = TokenBucket.get('tests-shared', calls=1, period=1)
+    assert TokenBucket.get('tests-shared', calls=99, period=1) is first
+    assert TokenBucket.get('tests-other', calls=1, period=1) is not first
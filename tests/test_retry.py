@@ -0,0 +1,82 @@
+import time
+
+import pytest
+import requests
+
+from dionysia_tools.utils.retry import RetryBudget, RetryPolicy
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    waits = []
+    monkeypatch.setattr(time, 'sleep', waits.append)
+    return waits
+
+
+def sender(*outcomes):
+    outcomes = list(outcomes)
+
+    def send():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return send
+
+
+def test_retries_server_errors_until_success(no_sleep):
+    ok = Response(200)
+    assert RetryPolicy(max_tries=3).call(sender(Response(503), Response(502), ok)) is ok
+    assert len(no_sleep) == 2
+
+
+def test_final_client_error_is_not_retried(no_sleep):
+    not_found = Response(404)
+    assert RetryPolicy().call(sender(not_found)) is not_found
+    assert no_sleep == []
+
+
+def test_returns_last_response_after_max_tries():
+    last = Response(500)
+    assert RetryPolicy(max_tries=2).call(sender(Response(500), last)) is last
+
+
+def test_raises_last_connection_error():
+    error = requests.exceptions.ConnectionError('down')
+    with pytest.raises(requests.exceptions.ConnectionError):
+        RetryPolicy(max_tries=2).call(sender(requests.exceptions.Timeout(), error))
+
+
+def test_retry_after_seconds_is_honoured(no_sleep):
+    RetryPolicy().call(sender(Response(429, {'Retry-After': '7'}), Response(200)))
+    assert no_sleep == [7.0]
+
+
+def test_wait_over_max_wait_gives_up(no_sleep):
+    throttled = Response(429, {'Retry-After': '120'})
+    assert RetryPolicy(max_wait=60).call(sender(throttled, Response(200))) is throttled
+    assert no_sleep == []
+
+
+def test_ratelimit_reset_delta():
+    headers = {'X-Ratelimit-Remaining': '0', 'X-Ratelimit-Reset': '12'}
+    assert RetryPolicy._header_wait(headers) == 12.0
+    assert RetryPolicy._header_wait({}) is None
+
+
+def test_spent_budget_stops_retrying(no_sleep):
+    policy = RetryPolicy(max_tries=5, budget=RetryBudget(retries=1, sleep=300))
+    last = Response(503)
+    assert policy.call(sender(Response(503, {'Retry-After': '1'}), last)) is last
+    assert policy.call(sender(Response(503), Response(200))).status_code == 503
+    assert no_sleep == [1.0]